@@ -14,7 +14,8 @@ from utils.template_renderer import TemplateRenderer
 from utils.constants import (
     NIFTI_EXTENSIONS, DICOM_EXTENSIONS, IMAGE_EXTENSIONS,
     MESSAGES, VIEWER_HEIGHT, detect_modality_from_data,
-    load_colormap_data, SLICE_TYPE_MAP, load_3d_render_config
+    load_colormap_data, SLICE_TYPE_MAP, load_3d_render_config, viewer_nifti_url,
+    VIEWER_PREVIEW_FACTOR, pyramid_url, OUTPUT_DIR
 )
 
 # Import badge components
@@ -303,7 +304,7 @@ def render_viewer(selected_patient: str, selected_file: str):
 
     # Prepare volume URLs and overlays
     # Regular patient file
-    base_file_url = f"{EXTERNAL_IMAGE_SERVER_URL}/output/{selected_patient}/nifti/{selected_file}"
+    base_file_url = viewer_nifti_url(f"{EXTERNAL_IMAGE_SERVER_URL}/output/{selected_patient}/nifti/{selected_file}")
 
     # Create overlays from selected voxels
     overlays = []
@@ -350,6 +351,13 @@ def render_viewer(selected_patient: str, selected_file: str):
 
     # Prepare JavaScript data
     volume_list_js = json.dumps(volume_list_entries)
+    # The template fetches a coarse pyramid level alongside full resolution and paints
+    # it only if it arrives first; full resolution then replaces it.
+    # Pyramids exist for stored files only, so generated /batch overlays skip the preview.
+    has_pyramids = all(f"/{OUTPUT_DIR}/" in entry["url"] for entry in volume_list_entries)
+    preview_volume_list_js = json.dumps([
+        {"url": pyramid_url(entry["url"], EXTERNAL_IMAGE_SERVER_URL)} for entry in volume_list_entries
+    ] if VIEWER_PREVIEW_FACTOR and has_pyramids else None)
     overlay_colors_js = json.dumps(overlays)
     custom_colormap_js = voxel_manager.create_custom_colormap_js()
 
@@ -445,6 +453,7 @@ def render_viewer(selected_patient: str, selected_file: str):
         'niivue_viewer.html',
         niivue_lib_content=niivue_lib_content,
         volume_list_js=volume_list_js,
+        preview_volume_list_js=preview_volume_list_js,
         overlay_colors_js=overlay_colors_js,
         custom_colormap_js=custom_colormap_js,
         image_server_url=EXTERNAL_IMAGE_SERVER_URL,
@@ -30,6 +30,35 @@ OUTPUT_DIR = "output"
 VOXELS_DIR = "voxels"
 NIFTI_DIR = "nifti"
 
+# Request .nii URLs so the image server sends the stored .nii.gz with
+# Content-Encoding: gzip and the browser inflates it natively while streaming.
+# Requires "gzip_content_encoding": true in the image server's server_settings.
+NIFTI_CONTENT_ENCODING = os.getenv('NIFTI_CONTENT_ENCODING', 'false').strip().lower() == 'true'
+
+
+def viewer_nifti_url(url: str) -> str:
+    """Rewrite a .nii.gz URL to its .nii form when Content-Encoding delivery is enabled."""
+    if NIFTI_CONTENT_ENCODING and url.endswith('.nii.gz'):
+        return url[:-len('.gz')]
+    return url
+
+# Selecting at least this many structures loads them as one composed volume from
+# the image server's /batch endpoint instead of one overlay file per structure.
+BATCH_OVERLAY_MIN_LABELS = int(os.getenv('BATCH_OVERLAY_MIN_LABELS', '2'))
+
+# Downsampling factor of the image server pyramid level the viewer paints first
+# before swapping in full resolution (2 or 4; 0 disables the preview pass).
+VIEWER_PREVIEW_FACTOR = int(os.getenv('VIEWER_PREVIEW_FACTOR', '4'))
+
+
+def pyramid_url(url: str, server_url: str, factor: int = VIEWER_PREVIEW_FACTOR) -> str:
+    """Return the /pyramid/{factor}/ URL for a volume served from ``server_url``."""
+    base = server_url.rstrip('/')
+    path = url[len(base):] if url.startswith(base) else url
+    if path.endswith('.nii'):
+        path += '.gz'
+    return f"{base}/pyramid/{factor}/{path.lstrip('/')}"
+
 # Viewer settings defaults
 DEFAULT_VIEWER_SETTINGS = {
     'slice_type': 'Multiplanar',
@@ -377,6 +406,11 @@ AVAILABLE_COLOR_MAPS = _ColormapAccessor()
 # Timeout settings
 SERVER_TIMEOUT = 10  # seconds
 
+# Keep folder listings between reruns and refresh them from the image server's
+# /api/events change feed instead of re-listing on every rerun.
+CHANGE_FEED_ENABLED = os.getenv('CHANGE_FEED', 'true').lower() in ('1', 'true', 'yes')
+CHANGE_FEED_READ_TIMEOUT = 60  # seconds; the server sends keep-alives every 15
+
 # Viewer dimensions
 VIEWER_HEIGHT = 1000
 
@@ -2,14 +2,108 @@
 
 import os
 import re
+import json
+import time
+import threading
 import requests
 from typing import List, Dict, Optional, Tuple, Set
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from utils.constants import SERVER_TIMEOUT
+from utils.constants import SERVER_TIMEOUT, CHANGE_FEED_ENABLED, CHANGE_FEED_READ_TIMEOUT
 
 load_dotenv()
 
+
+def _paths_related(a: str, b: str) -> bool:
+    """True if one path is the other or lies beneath it."""
+    return a == b or a.startswith(b + '/') or b.startswith(a + '/') or not a or not b
+
+
+class ListingCache:
+    """
+    Image server responses kept across Streamlit reruns until the server reports a change.
+    A daemon thread follows the server's /api/events feed; while it is connected,
+    a change event drops cached entries for the changed path, its parents and its
+    subtree, so only what changed is fetched again. Nothing is cached while the
+    feed is down.
+    """
+
+    def __init__(self, image_server_url: str):
+        self.events_url = f"{image_server_url}/api/events"
+        self.connected = False
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._follow, name="change-feed", daemon=True).start()
+
+    def get(self, key: tuple):
+        """Return (cached value or None, generation to pass back to put)."""
+        with self._lock:
+            return (self._entries.get(key) if self.connected else None), self._generation
+
+    def put(self, key: tuple, value, generation: int):
+        # A change reported while the request was in flight makes its result stale
+        with self._lock:
+            if self.connected and generation == self._generation:
+                self._entries[key] = value
+
+    def invalidate(self, path: Optional[str] = None):
+        with self._lock:
+            self._generation += 1
+            if path is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if _paths_related(key[0], path)]:
+                del self._entries[key]
+
+    def _follow(self):
+        last_event_id = None
+        retry_delay = 1
+        while True:
+            headers = {'Last-Event-ID': last_event_id} if last_event_id else {}
+            try:
+                with requests.get(self.events_url, headers=headers, stream=True,
+                                  timeout=(SERVER_TIMEOUT, CHANGE_FEED_READ_TIMEOUT)) as response:
+                    if response.status_code != 200:
+                        raise requests.exceptions.RequestException(f"HTTP {response.status_code}")
+                    self.connected = True
+                    retry_delay = 1
+                    event = {}
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line:
+                            field, _, value = line.partition(':')
+                            event[field] = value[1:] if value.startswith(' ') else value
+                            continue
+                        last_event_id = event.get('id', last_event_id)
+                        if event.get('event') == 'reset':
+                            self.invalidate()
+                        elif event.get('event') == 'change':
+                            self.invalidate(json.loads(event['data'])['path'])
+                        event = {}
+            except (requests.exceptions.RequestException, ValueError) as e:
+                if retry_delay == 1:
+                    print(f"Change feed unavailable at {self.events_url}, listings will not be cached: {e}")
+            with self._lock:
+                self.connected = False
+                self._entries.clear()
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 60)
+
+
+_listing_caches = {}
+_listing_caches_lock = threading.Lock()
+
+
+def listing_cache_for(image_server_url: str) -> Optional[ListingCache]:
+    """Shared ListingCache per image server, so one feed connection serves every rerun."""
+    if not CHANGE_FEED_ENABLED:
+        return None
+    with _listing_caches_lock:
+        if image_server_url not in _listing_caches:
+            _listing_caches[image_server_url] = ListingCache(image_server_url)
+        return _listing_caches[image_server_url]
+
+
 class DataManager:
     def __init__(self, image_server_url: str, force_external_url: bool = False):
         self.initial_image_server_url = image_server_url.rstrip('/')
@@ -20,6 +114,7 @@ class DataManager:
         self.output_folder = os.getenv('OUTPUT_FOLDER')
         if not self.output_folder or not os.path.isabs(self.output_folder):
             raise ValueError("OUTPUT_FOLDER must be set as an absolute path in .env")
+        self.listing_cache = listing_cache_for(self.image_server_url)
 
     def _find_working_image_server_url(self, initial_url: str) -> str:
         print(f"DEBUG: Using configured image server URL: {initial_url}")
@@ -54,9 +149,66 @@ class DataManager:
             print(f"Error parsing directory listing: {e}")
         return items
 
+    @staticmethod
+    def _format_size(size_bytes: int) -> str:
+        if size_bytes < 1024 * 1024:
+            return f"{size_bytes:,} bytes"
+        return f"{size_bytes / (1024 * 1024):.1f} MB"
+
+    def parse_json_listing(self, entries: List[Dict]) -> List[Dict]:
+        """Convert JSON listing entries from the image server into folder content items."""
+        items = []
+        for entry in entries:
+            is_directory = entry.get('type') == 'directory'
+            size_bytes = entry.get('size') or 0
+            item = {
+                'name': entry.get('name', ''),
+                'is_directory': is_directory,
+                'size_bytes': size_bytes,
+                'size_display': "N/A" if is_directory else self._format_size(size_bytes),
+            }
+            if 'children' in entry:
+                item['children'] = self.parse_json_listing(entry['children'])
+            items.append(item)
+        return items
+
+    def get_folder_tree(self, folder_path: str, depth: int = 1, glob: Optional[str] = None) -> Optional[List[Dict]]:
+        """
+        Fetch a folder listing from the image server's JSON API in one request.
+        With depth > 1, directory items carry a 'children' list of the same shape;
+        glob filters files only (e.g. '*.nii.gz').
+        Returns None if the server is unreachable or does not support JSON listings.
+        """
+        url_path = folder_path.strip('/')
+        cache_key = (url_path, depth, glob)
+        if self.listing_cache is not None:
+            cached, generation = self.listing_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        url = f"{self.image_server_url}/{url_path}/" if url_path else f"{self.image_server_url}/"
+        params = {'format': 'json', 'depth': depth}
+        if glob:
+            params['glob'] = glob
+        try:
+            response = requests.get(url, params=params, timeout=SERVER_TIMEOUT)
+            if response.status_code == 200 and response.headers.get('content-type', '').startswith('application/json'):
+                items = self.parse_json_listing(response.json().get('entries', []))
+                if self.listing_cache is not None:
+                    self.listing_cache.put(cache_key, items, generation)
+                return items
+            elif response.status_code not in (200, 404):
+                print(f"Image server returned HTTP {response.status_code} for URL: {url}")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Could not fetch JSON listing from {url}: {e}")
+        return None
+
     def get_folder_contents(self, folder_path: str) -> Optional[List[Dict[str, str]]]:
         """Fetch contents of a specific folder from the image server."""
-        # The new fileserver serves from its root, so the URL path matches the file path
+        items = self.get_folder_tree(folder_path)
+        if items is not None:
+            return items
+
+        # Fall back to scraping the HTML listing of older image servers
         url_path = folder_path.strip('/')
         url = f"{self.image_server_url}/{url_path}" if url_path else self.image_server_url
         
@@ -89,6 +241,29 @@ class DataManager:
             ])
         return []
 
+    def fetch_label_manifest(self, patient_id: str, ct_scan_folder_name: str) -> Optional[List[Dict]]:
+        """
+        Fetch the per-scan label manifest (IDs, names, voxel counts, bounding boxes
+        and per-label file names) from the image server's labels endpoint.
+        Returns None if the server does not provide it.
+        """
+        cache_key = (f"output/{patient_id}/voxels/{ct_scan_folder_name}", 'labels', None)
+        if self.listing_cache is not None:
+            cached, generation = self.listing_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        url = f"{self.image_server_url}/output/{patient_id}/voxels/{ct_scan_folder_name}/labels"
+        try:
+            response = requests.get(url, timeout=SERVER_TIMEOUT)
+            if response.status_code == 200:
+                labels = response.json().get('labels', [])
+                if self.listing_cache is not None:
+                    self.listing_cache.put(cache_key, labels, generation)
+                return labels
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Could not fetch label manifest from {url}: {e}")
+        return None
+
     # ... The rest of the functions in this class remain the same ...
     def fetch_available_voxel_labels(
         self,
@@ -100,12 +275,21 @@ class DataManager:
             return set(), {}
         try:
             ct_scan_folder_name = filename.replace('.nii.gz', '').replace('.nii', '')
-            voxels_folder_url = f"{self.image_server_url}/output/{patient_id}/voxels/{ct_scan_folder_name}/"
-            resp = requests.get(voxels_folder_url, timeout=SERVER_TIMEOUT)
-            if resp.status_code != 200:
-                return set(), {}
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            voxel_files = [link.get('href') for link in soup.find_all('a') if link.get('href') and link.get('href').endswith('.nii.gz')]
+            manifest_labels = self.fetch_label_manifest(patient_id, ct_scan_folder_name)
+            if manifest_labels is not None:
+                available = [label for label in manifest_labels if label.get('filename')]
+                return {label['id'] for label in available}, {label['id']: label['name'] for label in available}
+
+            items = self.get_folder_tree(f"output/{patient_id}/voxels/{ct_scan_folder_name}", glob='*.nii.gz')
+            if items is not None:
+                voxel_files = [item['name'] for item in items if not item['is_directory']]
+            else:
+                voxels_folder_url = f"{self.image_server_url}/output/{patient_id}/voxels/{ct_scan_folder_name}/"
+                resp = requests.get(voxels_folder_url, timeout=SERVER_TIMEOUT)
+                if resp.status_code != 200:
+                    return set(), {}
+                soup = BeautifulSoup(resp.text, 'html.parser')
+                voxel_files = [link.get('href') for link in soup.find_all('a') if link.get('href') and link.get('href').endswith('.nii.gz')]
             available_ids = {filename_to_id_mapping[f.split('/')[-1]] for f in voxel_files if f.split('/')[-1] in filename_to_id_mapping}
             id_to_name = {label_id: fname.replace('.nii.gz', '').replace('_', ' ') for fname, label_id in filename_to_id_mapping.items() if label_id in available_ids}
             return available_ids, id_to_name
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Label Splitting for Vista-3D Pipeline
+Splits a segmentation volume into per-label regions without rescanning the
+whole volume once per label.
+
+One ``bincount`` histogram and one ``ndimage.find_objects`` pass give every
+label's voxel count and bounding box; each label's mask, centroid and output
+volume are then built from its bounding-box crop only, with labels processed
+in parallel across threads.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+
+
+def label_volume(segmentation_img) -> np.ndarray:
+    """Integer label array of ``segmentation_img`` with negative values treated as background."""
+    data = np.asanyarray(segmentation_img.dataobj)
+    if not np.issubdtype(data.dtype, np.integer):
+        data = data.astype(np.int16)
+    if data.size and data.min() < 0:
+        data = np.where(data < 0, 0, data)
+    return data
+
+
+def _region(data: np.ndarray, label_id: int, bbox: tuple, voxel_count: int) -> dict:
+    crop = data[bbox] == label_id
+    centroid = []
+    for axis, axis_slice in enumerate(bbox):
+        # Voxels per plane along this axis, weighted by the plane's index
+        profile = crop.sum(axis=tuple(a for a in range(crop.ndim) if a != axis))
+        centroid.append(float(np.dot(profile, np.arange(axis_slice.start, axis_slice.stop)) / voxel_count))
+    return {"id": label_id, "voxel_count": voxel_count, "bbox": bbox, "centroid": centroid, "crop": crop}
+
+
+def split_labels(data: np.ndarray, max_workers: int = None) -> list:
+    """Regions of every non-zero label in ``data``, in ascending label order.
+
+    Each region has ``id``, ``voxel_count``, ``bbox`` (a tuple of slices),
+    ``centroid`` (voxel coordinates) and ``crop``, the boolean mask of the
+    label inside its bounding box.
+    """
+    if data.size == 0:
+        return []
+    # Both passes walk the array in memory order; NIfTI data is usually Fortran-ordered
+    counts = np.bincount(data.ravel(order='K'))
+    if np.isfortran(data):
+        bboxes = [bbox and bbox[::-1] for bbox in ndimage.find_objects(data.T)]
+    else:
+        bboxes = ndimage.find_objects(data)
+    label_ids = [int(label_id) for label_id in np.flatnonzero(counts) if label_id != 0]
+
+    def build(label_id):
+        return _region(data, label_id, bboxes[label_id - 1], int(counts[label_id]))
+
+    return list(_map(build, label_ids, max_workers))
+
+
+def write_label_volumes(data: np.ndarray, regions: list, write, max_workers: int = None) -> list:
+    """Call ``write(region, volume)`` with a full-size volume holding only that region's label.
+
+    Each thread reuses one zeroed volume, filling and clearing just the
+    region's bounding box, so no full-volume allocation or scan is made per
+    label; ``max_workers`` therefore bounds the full-size buffers alive at
+    once. ``volume`` is only valid during the call. Returns the results of
+    ``write`` in region order.
+    """
+    buffers = threading.local()
+
+    def write_one(region):
+        volume = getattr(buffers, "volume", None)
+        if volume is None:
+            volume = buffers.volume = np.zeros(data.shape, dtype=data.dtype, order='F' if np.isfortran(data) else 'C')
+        bbox = region["bbox"]
+        volume[bbox][region["crop"]] = region["id"]
+        try:
+            return write(region, volume)
+        finally:
+            volume[bbox] = 0
+
+    return list(_map(write_one, regions, max_workers))
+
+
+def _map(function, items: list, max_workers: int = None):
+    workers = min(max_workers or os.cpu_count() or 1, len(items))
+    if workers <= 1:
+        return map(function, items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, items))
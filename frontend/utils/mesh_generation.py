@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Surface Mesh Generation for Vista-3D Pipeline
+Turns each label of a segmentation into triangle meshes at several levels of
+detail, written as binary PLY under output/{patient}/ply/{scan}/.
+
+Marching cubes runs on each label's bounding-box crop only, and labels are
+meshed in parallel across a process pool. Coarser levels are produced from the
+full-resolution surface by vertex clustering.
+"""
+
+import os
+import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+from scipy import ndimage
+from skimage import measure
+
+# Vertex-clustering cell size in voxels for each level of detail (1 = full resolution)
+LOD_CELL_SIZES = (1, 2, 4)
+MESH_INDEX_FILENAME = "meshes.json"
+# Mesh workers start from a clean server process rather than a fork of the caller:
+# segment.py runs inference, post-processing and gzip threads, and a forked child
+# can inherit a lock one of them held and deadlock
+MESH_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def decimate_vertex_clustering(verts: np.ndarray, faces: np.ndarray, cell: float):
+    """Merge vertices that fall in the same ``cell``-sized grid cube and drop collapsed faces."""
+    keys = np.floor(verts / cell).astype(np.int64)
+    _, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse)
+    merged = np.stack([np.bincount(inverse, weights=verts[:, axis]) for axis in range(3)], axis=1) / counts[:, None]
+
+    new_faces = inverse[faces]
+    keep = (new_faces[:, 0] != new_faces[:, 1]) & (new_faces[:, 1] != new_faces[:, 2]) & (new_faces[:, 0] != new_faces[:, 2])
+    new_faces = new_faces[keep]
+    _, first = np.unique(np.sort(new_faces, axis=1), axis=0, return_index=True)
+    new_faces = new_faces[np.sort(first)]
+
+    used, compact = np.unique(new_faces, return_inverse=True)
+    return merged[used], compact.reshape(new_faces.shape)
+
+
+def write_ply(path: Path, verts: np.ndarray, faces: np.ndarray):
+    """Write a binary little-endian PLY with float32 positions and uint32 triangle indices."""
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(verts)}\n"
+        "property float x\nproperty float y\nproperty float z\n"
+        f"element face {len(faces)}\n"
+        "property list uchar uint vertex_indices\n"
+        "end_header\n"
+    ).encode("ascii")
+    face_records = np.empty(len(faces), dtype=[("count", "u1"), ("indices", "<u4", (3,))])
+    face_records["count"] = 3
+    face_records["indices"] = faces
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(verts.astype("<f4").tobytes())
+        f.write(face_records.tobytes())
+    os.replace(tmp_path, path)
+
+
+def mesh_label(job: dict) -> dict:
+    """Mesh one label crop at every level of detail. Runs in a worker process."""
+    crop = np.pad(job["crop"], 1).astype(np.uint8)
+    verts, faces, _, _ = measure.marching_cubes(crop, level=0.5)
+    verts += np.asarray(job["offset"], dtype=np.float64) - 1
+
+    affine = np.asarray(job["affine"])
+    if np.linalg.det(affine[:3, :3]) > 0:
+        # marching_cubes winds triangles inward-facing in index space; reverse them
+        # unless the voxel-to-world mapping is mirrored, so world normals face out
+        faces = faces[:, ::-1]
+
+    out_dir = Path(job["out_dir"])
+    entry = {"id": job["id"], "name": job["name"], "files": [], "triangles": []}
+    for cell in job["cell_sizes"]:
+        lod_verts, lod_faces = (verts, faces) if cell <= 1 else decimate_vertex_clustering(verts, faces, cell)
+        world = lod_verts @ affine[:3, :3].T + affine[:3, 3]
+        filename = f"{job['file_stem']}_lod{len(entry['files'])}.ply"
+        write_ply(out_dir / filename, world, lod_faces)
+        entry["files"].append(filename)
+        entry["triangles"].append(int(len(lod_faces)))
+    return entry
+
+
+def label_file_stem(label_name: str) -> str:
+    """File stem used for a label's outputs, matching the per-label voxel files."""
+    return label_name.lower().replace(' ', '_').replace('-', '_')
+
+
+def generate_label_meshes(segmentation_img, ct_scan_name: str, ply_base_dir: Path, label_names: dict,
+                          cell_sizes=LOD_CELL_SIZES, max_workers: int = None):
+    """Write LOD meshes for every label in ``label_names`` (id -> name) present in the segmentation.
+
+    Returns the mesh index, also written to ``ply/{scan}/meshes.json``.
+    """
+    ct_scan_folder_name = ct_scan_name.replace('.nii.gz', '').replace('.nii', '')
+    out_dir = ply_base_dir / ct_scan_folder_name
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    data = np.asanyarray(segmentation_img.dataobj)
+    if not np.issubdtype(data.dtype, np.integer):
+        data = np.rint(data).astype(np.int16)
+    data = np.where(data < 0, 0, data)
+    affine = segmentation_img.affine
+
+    # One pass yields the bounding box of every label
+    jobs = []
+    for index, bbox in enumerate(ndimage.find_objects(data)):
+        label_id = index + 1
+        if bbox is None or label_id not in label_names:
+            continue
+        jobs.append({
+            "id": label_id,
+            "name": label_names[label_id],
+            "file_stem": label_file_stem(label_names[label_id]),
+            "crop": data[bbox] == label_id,
+            "offset": [s.start for s in bbox],
+            "affine": affine,
+            "out_dir": str(out_dir),
+            "cell_sizes": tuple(cell_sizes),
+        })
+
+    workers = max_workers or int(os.getenv('MESH_WORKERS', '0')) or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)),
+                                 mp_context=multiprocessing.get_context(MESH_START_METHOD)) as executor:
+            labels = list(executor.map(mesh_label, jobs))
+    else:
+        labels = [mesh_label(job) for job in jobs]
+
+    index = {"version": 1, "segmentation": "all.nii.gz", "lod_cell_sizes": list(cell_sizes), "labels": labels}
+    index_path = out_dir / MESH_INDEX_FILENAME
+    tmp_path = index_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def main():
+    """Backfill meshes for scans segmented before the mesh stage existed."""
+    from dotenv import load_dotenv
+    try:
+        from utils.config_manager import ConfigManager
+    except ModuleNotFoundError:
+        import sys
+        sys.path.append(str(Path(__file__).resolve().parents[1]))
+        from utils.config_manager import ConfigManager
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Generate LOD surface meshes from existing segmentations")
+    parser.add_argument("patient_folders", nargs='*', help="Patient folder(s) to process (default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: MESH_WORKERS or CPU count)")
+    args = parser.parse_args()
+
+    output_folder = os.getenv('OUTPUT_FOLDER')
+    if not output_folder or not os.path.isabs(output_folder):
+        raise ValueError("OUTPUT_FOLDER must be set in .env file with full absolute path")
+    output_folder = Path(output_folder)
+
+    config_manager = ConfigManager(config_dir=str(Path(__file__).resolve().parents[1] / "conf"))
+    label_names = {item['id']: item['name'] for item in config_manager.label_colors}
+
+    patients = args.patient_folders or sorted(p.name for p in output_folder.iterdir() if p.is_dir())
+    for patient_id in patients:
+        voxels_dir = output_folder / patient_id / "voxels"
+        if not voxels_dir.is_dir():
+            continue
+        for scan_dir in sorted(p for p in voxels_dir.iterdir() if (p / "all.nii.gz").exists()):
+            index = generate_label_meshes(
+                nib.load(str(scan_dir / "all.nii.gz")), scan_dir.name, output_folder / patient_id / "ply",
+                label_names, max_workers=args.workers,
+            )
+            print(f"{patient_id}/{scan_dir.name}: meshed {len(index['labels'])} labels")
+
+
+if __name__ == "__main__":
+    main()
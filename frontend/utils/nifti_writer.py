@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Parallel NIfTI Writer for Vista-3D Pipeline
+Writes ``.nii.gz`` files with the deflate work spread across cores, pigz-style:
+the image is streamed out in blocks that are compressed concurrently, each
+primed with the previous block's last 32 KiB so the ratio matches a
+single-threaded stream, and joined with sync flushes into one standard gzip
+member that any gzip reader (nibabel, NiiVue, gunzip) decodes unchanged.
+
+``.nii`` paths are written uncompressed. ``NIFTI_COMPRESSION_LEVEL=0`` keeps
+the ``.nii.gz`` names the viewer and image server expect but stores the data
+without compressing it, for hot working sets where CPU matters more than disk.
+"""
+
+import io
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import nibabel as nib
+
+# gzip level for .nii.gz outputs (nibabel's default is 1; 0 stores without compressing)
+NIFTI_COMPRESSION_LEVEL = int(os.getenv('NIFTI_COMPRESSION_LEVEL', '1'))
+# Threads shared by every compression in the process (0 = CPU count)
+NIFTI_COMPRESSION_THREADS = int(os.getenv('NIFTI_COMPRESSION_THREADS', '0')) or os.cpu_count() or 1
+# Uncompressed bytes per independently compressed block
+COMPRESSION_BLOCK_SIZE = 1024 * 1024
+DICTIONARY_SIZE = 32 * 1024
+
+# Fixed gzip header: deflate, no name, mtime 0, unknown OS
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _compression_pool():
+    # One pool per process so label writers running on their own threads share
+    # the cores instead of each starting a pool of their own
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=NIFTI_COMPRESSION_THREADS,
+                                           thread_name_prefix='nifti-gzip')
+        return _executor
+
+
+def _deflate_block(block: bytes, dictionary: bytes, level: int, last: bool) -> bytes:
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    # A sync flush ends the block on a byte boundary without marking the stream final
+    return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """Write-only file object that gzips into ``fileobj`` as one member, compressing blocks in parallel.
+
+    Writes are gathered into ``block_size`` blocks and handed to the shared
+    pool as they fill, with at most two blocks per thread in flight, so memory
+    stays bounded however much is written. ``close`` flushes the last block and
+    the gzip trailer; it does not close ``fileobj``.
+    """
+
+    def __init__(self, fileobj, level: int = None, block_size: int = COMPRESSION_BLOCK_SIZE):
+        self.fileobj = fileobj
+        self.level = NIFTI_COMPRESSION_LEVEL if level is None else level
+        self.block_size = block_size
+        self._buffer = bytearray()
+        self._dictionary = b''
+        self._pending = deque()
+        self._crc = 0
+        self._size = 0
+        self._max_pending = 2 * NIFTI_COMPRESSION_THREADS
+        fileobj.write(GZIP_HEADER)
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        # nibabel seeks to where it already is before writing; nothing else is supported
+        position = {io.SEEK_SET: 0, io.SEEK_CUR: self._size, io.SEEK_END: self._size}[whence] + offset
+        if position != self._size:
+            raise io.UnsupportedOperation("ParallelGzipWriter only writes forward")
+        return position
+
+    def write(self, data) -> int:
+        data = memoryview(data).cast('B')
+        # The checksum is computed here while the pool compresses earlier blocks
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, last=False)
+        return len(data)
+
+    def _submit(self, block: bytes, last: bool):
+        self._pending.append(_compression_pool().submit(_deflate_block, block, self._dictionary, self.level, last))
+        # Each block is primed with the previous one's tail so the ratio matches one stream
+        self._dictionary = block[-DICTIONARY_SIZE:]
+        while len(self._pending) > (0 if last else self._max_pending):
+            self.fileobj.write(self._pending.popleft().result())
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._submit(bytes(self._buffer), last=True)
+                self.fileobj.write(struct.pack('<II', self._crc, self._size & 0xffffffff))
+            finally:
+                self._buffer = bytearray()
+                super().close()
+
+
+def save_nifti(img, path, level: int = None) -> Path:
+    """Save ``img`` like ``nib.save``, compressing ``.nii.gz`` output across threads.
+
+    nibabel streams the header and then the voxel data slice by slice into a
+    ``ParallelGzipWriter``, so no serialized copy of the volume is held. The
+    file is written next to ``path`` and renamed into place, so readers never
+    see a partial volume and ``img`` may be backed by ``path`` itself.
+    """
+    path = Path(path)
+    if not path.name.endswith('.nii.gz') or not isinstance(img, nib.Nifti1Image):
+        nib.save(img, str(path))
+        return path
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        with open(tmp_path, 'wb') as f, ParallelGzipWriter(f, level) as writer:
+            img.to_stream(writer)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return path
@@ -8,14 +8,20 @@ from tqdm import tqdm
 import nibabel as nib
 import gzip
 import zipfile
-import io
 import numpy as np
+import struct
 import traceback
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 try:
     from utils.config_manager import ConfigManager
     from utils.constants import MIN_FILE_SIZE_MB
+    from utils.label_splitting import label_volume, split_labels, write_label_volumes
+    from utils.mesh_generation import generate_label_meshes
+    from utils.nifti_writer import save_nifti
+    from utils.vista3d_client import Vista3DClient
 except ModuleNotFoundError:
     # Allow running as a script: python utils/segment.py
     import sys as _sys
@@ -23,6 +29,10 @@ except ModuleNotFoundError:
     _sys.path.append(str(_Path(__file__).resolve().parents[1]))
     from utils.config_manager import ConfigManager
     from utils.constants import MIN_FILE_SIZE_MB
+    from utils.label_splitting import label_volume, split_labels, write_label_volumes
+    from utils.mesh_generation import generate_label_meshes
+    from utils.nifti_writer import save_nifti
+    from utils.vista3d_client import Vista3DClient
 
 # Load environment variables
 load_dotenv()
@@ -64,6 +74,29 @@ label_colors_list = config_manager.label_colors
 LABEL_DICT = {item['id']: item for item in label_colors_list}
 NAME_TO_ID_MAP = {item['name']: item['id'] for item in label_colors_list}
 
+# Per-scan label index written next to all.nii.gz and served by the image server
+MANIFEST_FILENAME = "manifest.json"
+
+# "nifti" writes one full-size NIfTI per label; "packed" writes a single
+# labels.vxmask of bit-packed bounding-box crops that the image server expands
+# back into the same per-label URLs on request.
+VOXEL_STORE = os.getenv('VOXEL_STORE', 'nifti').strip().lower()
+LABEL_STORE_FILENAME = "labels.vxmask"
+LABEL_STORE_MAGIC = b"VXMASK01"
+
+# Write LOD surface meshes to output/{patient}/ply/{scan}/ after the voxel files.
+# On by default: the viewer and DataManager look for ply/ per scan and otherwise
+# ray-march full label volumes; meshing a scan costs seconds next to its inference.
+GENERATE_MESHES = os.getenv('GENERATE_MESHES', 'true').strip().lower() == 'true'
+
+# Inference requests kept in flight, and threads decoding/writing the results
+INFERENCE_CONCURRENCY = int(os.getenv('INFERENCE_CONCURRENCY', '2'))
+POSTPROCESS_WORKERS = int(os.getenv('POSTPROCESS_WORKERS', '2'))
+# Zipped inference responses stay in memory up to this size before spilling to a temp file
+INFERENCE_SPOOL_BYTES = int(float(os.getenv('INFERENCE_SPOOL_MB', '512')) * 1024 * 1024)
+# Threads writing per-label files of one scan; each holds a full-size label volume
+LABEL_WRITE_WORKERS = max(1, int(os.getenv('LABEL_WRITE_WORKERS', '2')))
+
 
 
 def get_nifti_files_in_folder(folder_path: Path):
@@ -106,58 +139,307 @@ def create_patient_folder_structure(patient_id: str):
         'voxels': voxels_dir
     }
 
-def create_individual_voxel_files(segmentation_img, ct_scan_name: str, voxels_base_dir: Path, target_vessel_ids: list):
-    """Create individual voxel files for each label in the segmentation."""
+def notify_image_server(url_paths: list):
+    """Tell the image server which output folders were (re)written so its caches refresh."""
+    try:
+        requests.post(f"{IMAGE_SERVER_URL.rstrip('/')}/api/notify", json={"paths": url_paths}, timeout=2)
+    except requests.exceptions.RequestException:
+        # The image server also notices new files through directory mtimes
+        pass
+
+def write_label_manifest(ct_voxels_dir: Path, segmentation_img, labels: list):
+    """Write manifest.json describing the labels of a scan's segmentation."""
+    manifest = {
+        "version": 1,
+        "segmentation": "all.nii.gz",
+        "shape": [int(n) for n in segmentation_img.shape],
+        "affine": segmentation_img.affine.tolist(),
+        "labels": labels,
+    }
+    manifest_path = ct_voxels_dir / MANIFEST_FILENAME
+    tmp_path = manifest_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+def write_label_store(ct_voxels_dir: Path, segmentation_img, labels: list, crops: list):
+    """Write labels.vxmask: magic, uint64 index length, JSON index, then bit-packed label crops."""
+    index_labels = []
+    payload = []
+    offset = 0
+    for entry, crop in zip(labels, crops):
+        bits = np.packbits(crop.ravel(), bitorder='little')
+        index_labels.append({**entry, "offset": offset, "nbytes": int(bits.nbytes)})
+        payload.append(bits)
+        offset += bits.nbytes
+    index = json.dumps({
+        "version": 1,
+        "shape": [int(n) for n in segmentation_img.shape[:3]],
+        "affine": segmentation_img.affine.tolist(),
+        "labels": index_labels,
+    }).encode('utf-8')
+    store_path = ct_voxels_dir / LABEL_STORE_FILENAME
+    tmp_path = store_path.with_name(store_path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(LABEL_STORE_MAGIC)
+        f.write(struct.pack('<Q', len(index)))
+        f.write(index)
+        for bits in payload:
+            f.write(bits.tobytes())
+    os.replace(tmp_path, store_path)
+    return store_path
+
+def create_individual_voxel_files(segmentation_img, ct_scan_name: str, voxels_base_dir: Path, target_vessel_ids: list,
+                                  max_workers: int = None, write_workers: int = LABEL_WRITE_WORKERS):
+    """Create individual voxel files for each label in the segmentation.
+
+    Labels are split in one pass over the volume on ``max_workers`` threads and
+    written on ``write_workers``, each of which holds a full-size volume; see
+    utils/label_splitting.py. Returns the names of the files written: the
+    per-label files, or just the label store with VOXEL_STORE=packed.
+    """
     # Create folder for this CT scan's voxels
     ct_scan_folder_name = ct_scan_name.replace('.nii.gz', '').replace('.nii', '')
     ct_voxels_dir = voxels_base_dir / ct_scan_folder_name
     ct_voxels_dir.mkdir(parents=True, exist_ok=True)
     
     # Get the segmentation data
-    data = segmentation_img.get_fdata().astype(np.int16)
+    data = label_volume(segmentation_img)
     affine = segmentation_img.affine
     header = segmentation_img.header
     
-    # Find unique labels in the segmentation (excluding background/0)
-    unique_labels = np.unique(data)
-    unique_labels = unique_labels[unique_labels != 0]  # Remove background
+    # Counts, bounding boxes, centroids and masks of every label (excluding background/0)
+    regions = split_labels(data, max_workers=max_workers)
     
-    print(f"    Found {len(unique_labels)} unique labels in segmentation: {unique_labels}")
+    print(f"    Found {len(regions)} unique labels in segmentation: {[region['id'] for region in regions]}")
     
-    created_files = []
+    manifest_labels = []
+    packed_store = VOXEL_STORE == 'packed'
     
-    # Create individual voxel files for each label
-    for label_id in unique_labels:
+    for region in regions:
+        label_id = region['id']
+        manifest_labels.append({
+            "id": label_id,
+            "name": LABEL_DICT.get(label_id, {}).get('name', str(label_id)),
+            "voxel_count": region['voxel_count'],
+            "bbox": [[s.start, s.stop] for s in region['bbox']],
+            "centroid": [round(c, 2) for c in region['centroid']],
+            "filename": None,
+        })
         if label_id in LABEL_DICT:
-            label_info = LABEL_DICT[label_id]
-            label_name = label_info['name'].lower().replace(' ', '_').replace('-', '_')
-            
-            # Create binary mask for this label
-            label_data = np.zeros_like(data, dtype=np.int16)
-            label_data[data == label_id] = label_id
-            
-            # Only create file if there are voxels for this label
-            if np.any(label_data > 0):
-                # Create new NIfTI image for this label
-                label_img = nib.Nifti1Image(label_data, affine, header)
-                
-                # Save individual voxel file
-                voxel_filename = f"{label_name}.nii.gz"
-                voxel_path = ct_voxels_dir / voxel_filename
-                nib.save(label_img, voxel_path)
-                
-                voxel_count = np.sum(label_data > 0)
-                print(f"      Created {voxel_filename} with {voxel_count} voxels (label ID: {label_id})")
-                created_files.append(voxel_filename)
-    
-    print(f"    Created {len(created_files)} individual voxel files in {ct_voxels_dir}")
+            label_name = LABEL_DICT[label_id]['name'].lower().replace(' ', '_').replace('-', '_')
+            region['filename'] = manifest_labels[-1]['filename'] = f"{label_name}.nii.gz"
+
+    if packed_store:
+        # Served by the image server from labels.vxmask
+        write_label_store(ct_voxels_dir, segmentation_img, manifest_labels, [region['crop'] for region in regions])
+        print(f"    Packed {len(manifest_labels)} label masks into {LABEL_STORE_FILENAME}")
+        created_files = [LABEL_STORE_FILENAME]
+    else:
+        def save_label(region, label_data):
+            # Create and save a NIfTI image holding just this label
+            save_nifti(nib.Nifti1Image(label_data, affine, header), ct_voxels_dir / region['filename'])
+            print(f"      Created {region['filename']} with {region['voxel_count']} voxels (label ID: {region['id']})")
+
+        labeled_regions = [region for region in regions if 'filename' in region]
+        write_label_volumes(data, labeled_regions, save_label, max_workers=write_workers)
+        created_files = [region['filename'] for region in labeled_regions]
+        print(f"    Created {len(created_files)} individual voxel files in {ct_voxels_dir}")
+
+    write_label_manifest(ct_voxels_dir, segmentation_img, manifest_labels)
     return created_files
 
+def request_inference(client: Vista3DClient, job: dict):
+    """POST one scan to the VISTA3D NIM and return the zipped segmentation in a spooled buffer.
+
+    Runs on the inference pool. The body is streamed into memory (spilling to
+    disk only past INFERENCE_SPOOL_MB) instead of being held as one bytes object.
+    """
+    nifti_file_path = job['nifti_file_path']
+    # Use the original nifti file path for inference
+    # Calculate relative path from output folder to the nifti file
+    relative_path_to_nifti = nifti_file_path.relative_to(NIFTI_INPUT_BASE_DIR)
+
+    # Build URL using Vista3D-accessible image server configuration
+    # Vista3D server needs the full path including /output/ prefix
+    vista3d_input_url = f"{VISTA3D_IMAGE_SERVER_URL.rstrip('/')}/output/{relative_path_to_nifti}"
+    # Read API Key from environment
+    api_key = os.getenv('VISTA3D_API_KEY')
+
+    payload = {"image": vista3d_input_url, "prompts": {"labels": job['target_vessels']}}
+    headers = {"Content-Type": "application/json"}
+    # Update headers to include the Authorization token if the key exists
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    print(f"\n  Processing: {job['patient_folder_name']}/{nifti_file_path.name}")
+    print(f"    Vista3D Server: {VISTA3D_SERVER}")
+    print(f"    Image URL (Vista3D-accessible): {vista3d_input_url}")
+    print(f"    Target vessels: {job['target_vessels']}")
+    if api_key:
+        print("    Using API Key for authentication.")
+
+    inference_response = client.infer(payload, headers=headers, label=f"{job['patient_folder_name']}/{nifti_file_path.name}",
+                                      stream=True)
+
+    # Add detailed error information
+    if not inference_response.ok:
+        print(f"    ❌ API Error for {nifti_file_path.name}: {inference_response.status_code} {inference_response.reason}")
+        try:
+            error_detail = inference_response.json()
+            print(f"    Error details: {error_detail}")
+        except:
+            print(f"    Response content: {inference_response.text}")
+
+    with inference_response:
+        inference_response.raise_for_status()
+        spool = tempfile.SpooledTemporaryFile(max_size=INFERENCE_SPOOL_BYTES)
+        try:
+            for chunk in inference_response.iter_content(chunk_size=1024 * 1024):
+                spool.write(chunk)
+        except Exception:
+            spool.close()
+            raise
+    spool.seek(0)
+    return spool
+
+
+def decode_segmentation(zipped_response):
+    """Load the segmentation inside the NIM's zip response as an int16 NIfTI image.
+
+    The zip member is decompressed as a stream straight into nibabel's
+    in-memory loader, so the voxel data is materialized once, in its on-disk
+    dtype, and cast to int16 (a no-op view change for int16 results) without a
+    float intermediate.
+    """
+    with zipfile.ZipFile(zipped_response, 'r') as zip_ref:
+        with zip_ref.open(zip_ref.namelist()[0]) as member:
+            stream = gzip.GzipFile(fileobj=member) if member.peek(2)[:2] == b'\x1f\x8b' else member
+            img_loaded = nib.Nifti1Image.from_stream(stream)
+            # On-disk dtype unless the header scales values; float labels truncate as before
+            data = np.asanyarray(img_loaded.dataobj).astype(np.int16, copy=False)
+    affine = img_loaded.affine
+
+    # Create a new NIfTI header to ensure 3D dimensions
+    new_header = nib.Nifti1Header()
+    new_header.set_data_shape(data.shape)
+    new_header.set_data_dtype(np.int16) # Set dtype based on the numpy array
+    return nib.Nifti1Image(data, affine, new_header)
+
+
+def postprocess_segmentation(job: dict, zipped_response):
+    """Decode a segmentation and write all.nii.gz, the per-label outputs and meshes. Runs on the post-processing pool."""
+    nifti_file_path = job['nifti_file_path']
+    patient_folder_name = job['patient_folder_name']
+    ct_scan_folder_name = job['ct_scan_folder_name']
+    patient_dirs = job['patient_dirs']
+    segmentation_output_path = job['segmentation_output_path']
+
+    try:
+        raw_nifti_img = decode_segmentation(zipped_response)
+    except Exception as load_error:
+        print(f"    ❌ Error loading NIfTI from the inference response for {nifti_file_path.name}: {load_error}")
+        traceback.print_exc()
+        raise
+    finally:
+        zipped_response.close()
+    print(f"    Shape of data array for {nifti_file_path.name}: {raw_nifti_img.shape}")
+    print(f"    Data type of raw_nifti_img data: {raw_nifti_img.get_data_dtype()}")
+    print(f"    NIfTI header datatype: {raw_nifti_img.header['datatype']}")
+    # Save full segmentation to voxels folder
+    save_nifti(raw_nifti_img, segmentation_output_path)
+    print(f"    Successfully saved segmentation: {patient_folder_name}/{ct_scan_folder_name}/{segmentation_output_path.name}")
+
+    # Create individual voxel files, or the packed label store
+    print(f"    Creating {'packed label store' if VOXEL_STORE == 'packed' else 'individual voxel files'}...")
+    created_voxels = create_individual_voxel_files(
+        raw_nifti_img, 
+        nifti_file_path.name, 
+        patient_dirs['voxels'], 
+        job['target_vessel_ids'],
+        max_workers=job['mesh_workers'],
+    )
+    if VOXEL_STORE == 'packed':
+        print(f"    Wrote {', '.join(created_voxels)} for {nifti_file_path.name}")
+    else:
+        print(f"    Created {len(created_voxels)} individual voxel files for {nifti_file_path.name}")
+    changed_paths = [f"output/{patient_folder_name}/voxels/{ct_scan_folder_name}"]
+
+    if GENERATE_MESHES:
+        print(f"    Generating label meshes...")
+        try:
+            mesh_index = generate_label_meshes(
+                raw_nifti_img,
+                nifti_file_path.name,
+                patient_dirs['base'] / "ply",
+                {label_id: info['name'] for label_id, info in LABEL_DICT.items()},
+                max_workers=job['mesh_workers'],
+            )
+            print(f"    Created meshes for {len(mesh_index['labels'])} labels")
+            changed_paths.append(f"output/{patient_folder_name}/ply/{ct_scan_folder_name}")
+        except Exception as mesh_error:
+            # Meshes are optional; the voxel outputs above are already complete
+            print(f"    ⚠️ Mesh generation failed: {mesh_error}")
+    notify_image_server(changed_paths)
+
+
+def run_segmentation_jobs(jobs: list, client: Vista3DClient, concurrency: int, postprocess_workers: int) -> list:
+    """Run inference for ``jobs`` with up to ``concurrency`` requests in flight.
+
+    Each response is handed to a separate post-processing pool, so the NIM
+    works on the next scans while earlier results are decoded, split and
+    written. Fetching pauses while more than two results per worker are waiting,
+    which bounds the number of zipped segmentations held in memory.
+    Returns the jobs that failed.
+    """
+    queue = deque(jobs)
+    failed = []
+    inferring = {}
+    postprocessing = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="inference") as inference_pool, \
+            ThreadPoolExecutor(max_workers=postprocess_workers, thread_name_prefix="postprocess") as postprocess_pool, \
+            tqdm(total=len(jobs), desc="Processing NIfTI files") as progress:
+        while queue or inferring or postprocessing:
+            while queue and len(inferring) < concurrency and len(postprocessing) < 2 * postprocess_workers:
+                job = queue.popleft()
+                inferring[inference_pool.submit(request_inference, client, job)] = job
+            done, _ = wait(list(inferring) + list(postprocessing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in inferring:
+                    job = inferring.pop(future)
+                    try:
+                        postprocessing[postprocess_pool.submit(postprocess_segmentation, job, future.result())] = job
+                        continue
+                    except requests.exceptions.RequestException as e:
+                        print(f"\n  Error during inference for {job['nifti_file_path'].name}: {e}")
+                        failed.append(job)
+                    except Exception as e:
+                        print(f"\n  An unexpected error occurred for {job['nifti_file_path'].name}: {e}")
+                        failed.append(job)
+                else:
+                    job = postprocessing.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"\n  An unexpected error occurred for {job['nifti_file_path'].name}: {e}")
+                        failed.append(job)
+                progress.update(1)
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(description="Vista3D Batch Segmentation Script")
     parser.add_argument("patient_folders", type=str, nargs='*', default=None, help="Name(s) of the patient folder(s) to process.")
     parser.add_argument("--force", action="store_true", help="Overwrite existing segmentation files.")
+    parser.add_argument("--concurrency", type=int, default=INFERENCE_CONCURRENCY,
+                        help="Inference requests kept in flight (default: INFERENCE_CONCURRENCY or 2)")
+    parser.add_argument("--postprocess-workers", type=int, default=POSTPROCESS_WORKERS,
+                        help="Threads decoding and writing results (default: POSTPROCESS_WORKERS or 2)")
     args = parser.parse_args()
+    concurrency = max(1, args.concurrency)
+    postprocess_workers = max(1, args.postprocess_workers)
+    # Split the mesh process pool between concurrently post-processed scans
+    mesh_workers = int(os.getenv('MESH_WORKERS', '0')) or max(1, (os.cpu_count() or 1) // postprocess_workers)
 
     # Create output directories if they don't exist
     NIFTI_INPUT_BASE_DIR.mkdir(parents=True, exist_ok=True)
@@ -181,6 +463,9 @@ def main():
 
     print("--- Vista3D Batch Segmentation Script ---")
 
+    # First pass: resolve every scan to segment; the dispatcher below runs them
+    jobs = []
+
     for patient_folder_name in tqdm(patient_folders_to_process, desc="Processing patients"):
         # The patient folder is now the base for nifti, scans, etc.
         patient_base_path = NIFTI_INPUT_BASE_DIR / patient_folder_name
@@ -240,7 +525,7 @@ def main():
                 print(f"No NIfTI files found in {patient_nifti_path}. Skipping patient.")
             continue
 
-        for nifti_file_path in tqdm(all_nifti_files, desc="Processing NIfTI files"):
+        for nifti_file_path in all_nifti_files:
             # The NIfTI file is already in its final destination.
             # The copy step is no longer needed.
             
@@ -255,115 +540,28 @@ def main():
                 print(f"\n  Skipping {nifti_file_path.name} as segmentation already exists. Use --force to overwrite.")
                 continue
 
-            try:
-                # Use the original nifti file path for inference
-                # Calculate relative path from output folder to the nifti file
-                relative_path_to_nifti = nifti_file_path.relative_to(NIFTI_INPUT_BASE_DIR)
-                
-                # Build URL using Vista3D-accessible image server configuration
-                # Vista3D server needs the full path including /output/ prefix
-                vista3d_input_url = f"{VISTA3D_IMAGE_SERVER_URL.rstrip('/')}/output/{relative_path_to_nifti}"
-                # Read API Key from environment
-                api_key = os.getenv('VISTA3D_API_KEY')
-
-                    
-                payload = {"image": vista3d_input_url, "prompts": {"labels": target_vessels}}
-                headers = {"Content-Type": "application/json"}
-                # Update headers to include the Authorization token if the key exists
-                if api_key:
-                    headers["Authorization"] = f"Bearer {api_key}"
-                print(f"\n  Processing: {nifti_file_path.name}")
-                print(f"    Vista3D Server: {VISTA3D_SERVER}")
-                print(f"    Image URL (Vista3D-accessible): {vista3d_input_url}")
-                print(f"    Target vessels: {target_vessels}")
-                if api_key:
-                    print("    Using API Key for authentication.")
-
-
-                inference_response = requests.post(VISTA3D_INFERENCE_URL, json=payload, headers=headers, verify=False)
-                
-                # Add detailed error information
-                if not inference_response.ok:
-                    print(f"    ❌ API Error: {inference_response.status_code} {inference_response.reason}")
-                    try:
-                        error_detail = inference_response.json()
-                        print(f"    Error details: {error_detail}")
-                    except:
-                        print(f"    Response content: {inference_response.text}")
-                
-                inference_response.raise_for_status()
-
-                with zipfile.ZipFile(io.BytesIO(inference_response.content), 'r') as zip_ref:
-                    nifti_filename = zip_ref.namelist()[0]
-                    extracted_nifti_content = zip_ref.read(nifti_filename)
-                
-                # Create a temporary file to load the NIfTI image, as nibabel.load
-                # can have issues with in-memory BytesIO objects.
-                raw_nifti_img = None
-                tmp_path = None
-                try:
-                    # The '.nii.gz' suffix is important for nibabel to correctly decompress.
-                    with tempfile.NamedTemporaryFile(suffix=".nii.gz", delete=False) as tmp:
-                        tmp.write(extracted_nifti_content)
-                        tmp_path = tmp.name
-
-                    # Load the NIfTI image from the temporary file.
-                    img_loaded = nib.load(tmp_path)
-                    
-                    # Immediately load the data into memory to prevent issues with the temp file.
-                    # Get data as float, then explicitly convert to int16
-                    float_data = img_loaded.get_fdata(dtype=np.float32)
-                    data = np.zeros(float_data.shape, dtype=np.int16)
-                    data[:] = float_data[:]
-                    data = np.ascontiguousarray(data) # Ensure contiguous
-                    print(f"    Shape of data array: {data.shape}")
-                    affine = img_loaded.affine
-                    
-                    # Create a new NIfTI header to ensure 3D dimensions
-                    new_header = nib.Nifti1Header()
-                    new_header.set_data_shape(data.shape)
-                    new_header.set_data_dtype(np.int16) # Set dtype based on the numpy array
-                    
-                    # Create a new NIfTI image object in memory with the new header.
-                    raw_nifti_img = nib.Nifti1Image(data, affine, new_header)
-
-                except Exception as load_error:
-                    import traceback
-                    print(f"    ❌ Error loading NIfTI file with nibabel: {load_error}")
-                    print("    Full traceback for nibabel.load error:")
-                    traceback.print_exc()
-                    raise  # Re-raise the exception
-                finally:
-                    # Clean up the temporary file.
-                    if tmp_path and os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-
-                # After loading, check if the image object was created successfully
-                if raw_nifti_img is None:
-                    raise Exception("Failed to load NIfTI image from received content.")
-                
-                print(f"    Data type of raw_nifti_img data: {raw_nifti_img.get_fdata().dtype}")
-                print(f"    NIfTI header datatype: {raw_nifti_img.header['datatype']}")
-                # Save full segmentation to voxels folder
-                nib.save(raw_nifti_img, segmentation_output_path)
-                print(f"    Successfully saved segmentation: {segmentation_output_path.name}")
-                
-                # Create individual voxel files
-                print(f"    Creating individual voxel files...")
-                created_voxels = create_individual_voxel_files(
-                    raw_nifti_img, 
-                    nifti_file_path.name, 
-                    patient_dirs['voxels'], 
-                    target_vessel_ids
-                )
-                print(f"    Created {len(created_voxels)} individual voxel files")
-
-            except requests.exceptions.RequestException as e:
-                print(f"\n  Error during inference for {nifti_file_path.name}: {e}")
-            except Exception as e:
-                print(f"\n  An unexpected error occurred for {nifti_file_path.name}: {e}")
+            jobs.append({
+                'patient_folder_name': patient_folder_name,
+                'patient_dirs': patient_dirs,
+                'nifti_file_path': nifti_file_path,
+                'ct_scan_folder_name': ct_scan_folder_name,
+                'segmentation_output_path': segmentation_output_path,
+                'target_vessels': target_vessels,
+                'target_vessel_ids': target_vessel_ids,
+                'mesh_workers': mesh_workers,
+            })
+
+    if jobs:
+        print(f"\nSegmenting {len(jobs)} scans with {concurrency} inference requests in flight "
+              f"and {postprocess_workers} post-processing workers")
+        client = Vista3DClient.from_env(VISTA3D_INFERENCE_URL, pool_size=concurrency)
+        failed = run_segmentation_jobs(jobs, client, concurrency, postprocess_workers)
+        print(f"\n{client.summary()}")
+        if failed:
+            print(f"⚠️ {len(failed)} of {len(jobs)} scans failed and can be re-run: "
+                  + ", ".join(f"{job['patient_folder_name']}/{job['nifti_file_path'].name}" for job in failed))
 
     print("\n--- Segmentation Process Complete ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
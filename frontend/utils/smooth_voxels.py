@@ -24,6 +24,7 @@ except ImportError:
 import sys
 sys.path.append(str(Path(__file__).parent))
 from constants import MIN_FILE_SIZE_MB
+from nifti_writer import save_nifti
 
 
 # Smoothing presets (FWHM in mm)
@@ -137,7 +138,7 @@ def smooth_voxel_file(file_path: Path, fwhm: float, method: str = "gaussian"):
             smoothed_img = nimage.smooth_img(img, fwhm=fwhm)
         
         # Save back to the same file (overwrite)
-        nib.save(smoothed_img, str(file_path))
+        save_nifti(smoothed_img, file_path)
         
         return True
     except Exception as e:
@@ -55,6 +55,7 @@ class TemplateRenderer:
             template_vars = {
                 'niivue_lib_content': niivue_lib_content,
                 'volume_list_js': volume_list_js,
+                'preview_volume_list_js': kwargs.get('preview_volume_list_js', 'null'),
                 'overlay_colors_js': overlay_colors_js,
                 'custom_colormap_js': custom_colormap_js,
                 'image_server_url': kwargs.get('image_server_url', ''),
@@ -0,0 +1,204 @@
+"""
+HTTP client for the VISTA3D NIM inference endpoint.
+
+One pooled ``requests.Session`` is shared by every inference thread, so scans
+reuse keep-alive connections instead of opening a new TCP/TLS connection each.
+Timeouts and 429/5xx responses are retried with jittered exponential backoff
+(honouring ``Retry-After``), and a circuit breaker pauses all dispatch for a
+cooldown after repeated consecutive failures. Each attempt's latency is printed
+and kept for an end-of-run summary.
+"""
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: rate limiting and server-side failures
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitBreaker:
+    """Stops dispatch after ``threshold`` consecutive failures.
+
+    While open, ``wait`` blocks callers for ``cooldown`` seconds, then lets a
+    single trial request through and tells that caller it holds the trial. Its
+    success closes the breaker; its failure opens it again. Failures of
+    requests sent before the breaker opened are counted but neither restart
+    the cooldown nor end the trial. A trial still unresolved after
+    ``trial_timeout`` seconds is presumed lost and another caller is let
+    through in its place.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0, trial_timeout: float = 610.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.trial_timeout = trial_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started = None
+        self._condition = threading.Condition()
+
+    @property
+    def trial_in_flight(self) -> bool:
+        return self.trial_started is not None
+
+    def wait(self) -> bool:
+        """Block while the breaker is open; True if the caller now holds the trial."""
+        with self._condition:
+            while self.opened_at is not None:
+                now = time.monotonic()
+                remaining = self.opened_at + self.cooldown - now
+                if self.trial_started is not None and now - self.trial_started >= self.trial_timeout:
+                    self.trial_started = None
+                if remaining <= 0 and self.trial_started is None:
+                    self.trial_started = now
+                    return True
+                # Waiters recheck at least once per cooldown, so none can block forever
+                self._condition.wait(timeout=remaining if remaining > 0 else
+                                     min(self.cooldown, self.trial_started + self.trial_timeout - now))
+            return False
+
+    def record_success(self):
+        with self._condition:
+            if self.opened_at is not None:
+                print("    ✅ VISTA3D server recovered, resuming dispatch")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started = None
+            self._condition.notify_all()
+
+    def record_failure(self, trial: bool = False):
+        """Count a failed request; ``trial`` is what ``wait`` returned for it."""
+        with self._condition:
+            self.failures += 1
+            if trial and self.opened_at is not None:
+                self.trial_started = None
+                self.opened_at = time.monotonic()
+            elif self.opened_at is None and self.failures >= self.threshold:
+                print(f"    ⚠️ VISTA3D server failing ({self.failures} consecutive errors), "
+                      f"pausing dispatch for {self.cooldown:.0f}s")
+                self.opened_at = time.monotonic()
+            self._condition.notify_all()
+
+
+def _retry_after_seconds(response):
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class Vista3DClient:
+    """Pooled, retrying client for ``POST /v1/vista3d/inference``."""
+
+    def __init__(self, inference_url: str, pool_size: int = 4, connect_timeout: float = 10.0,
+                 read_timeout: float = 600.0, max_retries: int = 3, backoff_base: float = 2.0,
+                 backoff_max: float = 60.0, breaker: CircuitBreaker = None, verify: bool = False):
+        self.inference_url = inference_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        self.session.verify = verify
+        # Retries are handled here so backoff and the breaker see every attempt
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.attempts = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, inference_url: str, pool_size: int = 4):
+        """Client configured from the VISTA3D_* timeout, retry and breaker variables in .env."""
+        return cls(
+            inference_url,
+            pool_size=pool_size,
+            connect_timeout=float(os.getenv('VISTA3D_CONNECT_TIMEOUT', '10')),
+            read_timeout=float(os.getenv('VISTA3D_READ_TIMEOUT', '600')),
+            max_retries=int(os.getenv('VISTA3D_MAX_RETRIES', '3')),
+            backoff_base=float(os.getenv('VISTA3D_BACKOFF_BASE', '2')),
+            backoff_max=float(os.getenv('VISTA3D_BACKOFF_MAX', '60')),
+            breaker=CircuitBreaker(
+                threshold=int(os.getenv('VISTA3D_BREAKER_THRESHOLD', '5')),
+                cooldown=float(os.getenv('VISTA3D_BREAKER_COOLDOWN', '30')),
+                trial_timeout=float(os.getenv('VISTA3D_CONNECT_TIMEOUT', '10'))
+                + float(os.getenv('VISTA3D_READ_TIMEOUT', '600')),
+            ),
+        )
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        """Seconds to wait before retry ``attempt`` + 1: Retry-After if given, else full jitter."""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def infer(self, payload: dict, headers: dict = None, label: str = "", stream: bool = False) -> requests.Response:
+        """POST ``payload``, retrying timeouts, connection errors and 429/5xx.
+
+        Returns the final response (the caller checks its status) or raises the
+        last connection error once retries are exhausted. With ``stream`` the
+        body is left unread for the caller; the logged latency is then time to
+        response headers.
+        """
+        for attempt in range(self.max_retries + 1):
+            trial = self.breaker.wait()
+            response = error = None
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.inference_url, json=payload, headers=headers, timeout=self.timeout,
+                                             stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            except BaseException:
+                # Anything else is not retried, but must still resolve a breaker trial
+                self.breaker.record_failure(trial)
+                raise
+            self._record(label, attempt, time.perf_counter() - start, response, error)
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+            self.breaker.record_failure(trial)
+            if attempt == self.max_retries:
+                if response is not None:
+                    return response
+                raise error
+            delay = self.backoff(attempt, _retry_after_seconds(response))
+            reason = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+            if response is not None:
+                response.close()
+            print(f"    ↻ Retrying {label} in {delay:.1f}s after {reason} "
+                  f"(attempt {attempt + 2}/{self.max_retries + 1})")
+            time.sleep(delay)
+
+    def _record(self, label: str, attempt: int, seconds: float, response, error):
+        outcome = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+        print(f"    ⏱ Inference {label}: {outcome} in {seconds:.2f}s (attempt {attempt + 1})")
+        with self._lock:
+            self.attempts.append((label, attempt, seconds, response.status_code if response is not None else None))
+
+    def summary(self) -> str:
+        """One-line latency summary of successful requests, for tracking inference SLOs."""
+        with self._lock:
+            attempts = list(self.attempts)
+        if not attempts:
+            return "No inference requests were made"
+        latencies = sorted(seconds for _, _, seconds, status in attempts if status is not None and status < 400)
+        retries = sum(1 for _, attempt, _, _ in attempts if attempt > 0)
+        failed = len(attempts) - len(latencies)
+        if not latencies:
+            return f"Inference: {len(attempts)} requests, none succeeded"
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        return (f"Inference latency over {len(latencies)} successful requests: "
+                f"p50 {percentile(0.5):.2f}s, p95 {percentile(0.95):.2f}s, max {latencies[-1]:.2f}s; "
+                f"{retries} retries, {failed} failed attempts")
@@ -10,7 +10,7 @@ import requests
 from bs4 import BeautifulSoup
 from .config_manager import ConfigManager
 from .data_manager import DataManager
-from .constants import OUTPUT_FOLDER_ABS, OUTPUT_DIR, VOXELS_DIR
+from .constants import OUTPUT_FOLDER_ABS, OUTPUT_DIR, VOXELS_DIR, viewer_nifti_url, BATCH_OVERLAY_MIN_LABELS
 
 
 class VoxelManager:
@@ -33,7 +33,16 @@ class VoxelManager:
         if not patient_id:
             return False
         
-        # First try to check via image server
+        # First try the image server's JSON listing: patient -> scan -> voxel files in one request
+        scan_dirs = self.data.get_folder_tree(f"{OUTPUT_DIR}/{patient_id}/{VOXELS_DIR}", depth=2, glob='*.nii.gz')
+        if scan_dirs is not None:
+            return any(
+                not child['is_directory']
+                for scan_dir in scan_dirs if scan_dir['is_directory']
+                for child in scan_dir.get('children', [])
+            )
+
+        # Older image servers only provide HTML listings
         try:
             voxels_folder_url = f"{self.data.image_server_url}/output/{patient_id}/voxels/"
             
@@ -152,11 +161,30 @@ class VoxelManager:
             overlays.append({
                 'label_id': 'all',
                 'label_name': 'All Segmentation',
-                'url': f"{base_url}/{OUTPUT_DIR}/{patient_id}/{VOXELS_DIR}/{ct_scan_folder_name}/all.nii.gz",
+                'url': viewer_nifti_url(f"{base_url}/{OUTPUT_DIR}/{patient_id}/{VOXELS_DIR}/{ct_scan_folder_name}/all.nii.gz"),
                 'use_custom_colormap': True  # Flag to use customSegmentationColormap
             })
             return overlays
         
+        # Several structures: fetch them as one composed label volume from the batch endpoint
+        selected_ids = []
+        for voxel_name in selected_voxels:
+            if voxel_name in self.config.label_dict:
+                label_id = self.config.label_dict[voxel_name]
+                if scan_modality == 'brain' and not self._is_brain_relevant_structure(label_id, voxel_name):
+                    continue
+                selected_ids.append(label_id)
+        if len(selected_ids) >= BATCH_OVERLAY_MIN_LABELS:
+            label_ids = ','.join(str(label_id) for label_id in sorted(selected_ids))
+            print(f"DEBUG: Loading {len(selected_ids)} selected voxels as one batch overlay")
+            overlays.append({
+                'label_id': 'batch',
+                'label_name': f'{len(selected_ids)} structures',
+                'url': f"{base_url}/batch/{patient_id}/{ct_scan_folder_name}/{label_ids}.nii.gz",
+                'use_custom_colormap': True
+            })
+            return overlays
+
         # Otherwise, create overlays for individual selected voxels
         print(f"DEBUG: Creating individual overlays for {len(selected_voxels)} voxels")
         for voxel_name in selected_voxels:
@@ -176,7 +204,7 @@ class VoxelManager:
                 overlays.append({
                     'label_id': label_id,
                     'label_name': voxel_name,
-                    'url': f"{base_url}/{OUTPUT_DIR}/{patient_id}/{VOXELS_DIR}/{ct_scan_folder_name}/{voxel_filename}",
+                    'url': viewer_nifti_url(f"{base_url}/{OUTPUT_DIR}/{patient_id}/{VOXELS_DIR}/{ct_scan_folder_name}/{voxel_filename}"),
                     'color': label_color
                 })
         
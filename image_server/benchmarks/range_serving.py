@@ -0,0 +1,107 @@
+"""
+Range-serving throughput benchmark for the image server.
+
+Drives the ASGI responses directly (no sockets) and reports MB/s per CPU
+second for the previous 8 KiB generator implementation and the current
+RangeFileResponse, for whole-file, single-range and multi-range requests.
+
+    python benchmarks/range_serving.py --size-mb 256 --repeat 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.responses import StreamingResponse
+
+# server.py validates these at import time
+_scratch = tempfile.mkdtemp(prefix="vista3d-bench-")
+os.environ.setdefault("OUTPUT_FOLDER", _scratch)
+os.environ.setdefault("DICOM_FOLDER", _scratch)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def legacy_range_response(file_path: Path, start: int, end: int) -> StreamingResponse:
+    """The pre-RangeFileResponse implementation: 8 KiB reads in a sync generator."""
+    content_length = end - start + 1
+
+    def iter_file_range():
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            remaining = content_length
+            while remaining > 0:
+                chunk = f.read(min(8192, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    return StreamingResponse(iter_file_range(), status_code=206, media_type="application/octet-stream")
+
+
+async def drive(response, range_header: str = None) -> int:
+    headers = [(b"range", range_header.encode())] if range_header else []
+    scope = {"type": "http", "method": "GET", "headers": headers, "asgi": {"spec_version": "2.4"}}
+    sent = 0
+
+    async def receive():
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += len(message.get("body", b""))
+
+    await response(scope, receive, send)
+    return sent
+
+
+def measure(label: str, make_response, range_header: str, repeat: int):
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    total = 0
+    for _ in range(repeat):
+        total += asyncio.run(drive(make_response(), range_header))
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    mb = total / (1024 * 1024)
+    print(f"  {label:<28} {mb / max(cpu, 1e-9):>10.1f} MB/s per core {mb / max(wall, 1e-9):>10.1f} MB/s wall")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image server range serving")
+    parser.add_argument("--size-mb", type=int, default=256, help="Size of the test file in MB")
+    parser.add_argument("--repeat", type=int, default=5, help="Requests per scenario")
+    args = parser.parse_args()
+
+    file_path = Path(_scratch) / "volume.bin"
+    with open(file_path, "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 * 1024))
+    size = file_path.stat().st_size
+    half = size // 2
+
+    def current(_request=None):
+        return server.RangeFileResponse(file_path, stat_result=file_path.stat())
+
+    print(f"File: {args.size_mb} MB, chunk size {server.adaptive_chunk_size(size) // 1024} KiB")
+    print("Whole file")
+    measure("legacy 8 KiB generator", lambda: legacy_range_response(file_path, 0, size - 1), None, args.repeat)
+    measure("RangeFileResponse", current, None, args.repeat)
+    print("Single range (second half)")
+    measure("legacy 8 KiB generator", lambda: legacy_range_response(file_path, half, size - 1), None, args.repeat)
+    measure("RangeFileResponse", current, f"bytes={half}-", args.repeat)
+    print("Multi range (4 parts, multipart/byteranges)")
+    quarter = size // 4
+    ranges = "bytes=" + ",".join(f"{i * quarter}-{i * quarter + quarter // 2}" for i in range(4))
+    measure("RangeFileResponse", current, ranges, args.repeat)
+
+    file_path.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Path-routing micro-benchmark for the image server.
+
+Times the per-request folder lookups behind ``serve_files`` (URL -> path
+mapping, access check and Cache-Control lookup) for the previous per-request
+scans over ``viewable_folders`` and the compiled ``FolderRoutes`` table, after
+checking that both give the same answers.
+
+    python benchmarks/routing.py --requests 200000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# server.py validates these at import time
+_scratch = tempfile.mkdtemp(prefix="vista3d-bench-")
+os.makedirs(os.path.join(_scratch, "output"), exist_ok=True)
+os.makedirs(os.path.join(_scratch, "dicom"), exist_ok=True)
+os.environ.setdefault("OUTPUT_FOLDER", os.path.join(_scratch, "output"))
+os.environ.setdefault("DICOM_FOLDER", os.path.join(_scratch, "dicom"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def legacy_map_url_to_actual_path(url_path: str) -> Path:
+    for folder_config in server.server_config.get("viewable_folders", []):
+        folder_url_path = folder_config.get("url_path", folder_config.get("name", ""))
+        if url_path.startswith(folder_url_path + "/") or url_path == folder_url_path:
+            actual_folder_path = Path(folder_config.get("path", ""))
+            if url_path == folder_url_path:
+                return actual_folder_path
+            else:
+                subpath = url_path[len(folder_url_path):].lstrip("/")
+                return actual_folder_path / subpath
+    return Path(server.output_folder) / url_path
+
+
+def legacy_is_allowed_directory(path: Path) -> bool:
+    try:
+        allowed_folder_paths = [Path(folder["path"]) for folder in server.server_config.get("viewable_folders", [])]
+        if path == Path(server.output_folder) or path == Path(server.dicom_folder):
+            return True
+        for allowed_path in allowed_folder_paths:
+            try:
+                path.relative_to(allowed_path)
+                return True
+            except ValueError:
+                continue
+        for base_folder in [Path(server.output_folder), Path(server.dicom_folder)]:
+            try:
+                path_parts = path.relative_to(base_folder).parts
+                if path_parts:
+                    allowed_url_paths = [folder["url_path"] for folder in server.server_config.get("viewable_folders", [])]
+                    if path_parts[0] in allowed_url_paths:
+                        return True
+            except ValueError:
+                continue
+        return False
+    except Exception:
+        return False
+
+
+def legacy_cache_control_for(path: Path) -> str:
+    for folder_config in server.server_config.get("viewable_folders", []):
+        if "cache_control" not in folder_config:
+            continue
+        try:
+            path.relative_to(Path(folder_config.get("path", "")).resolve())
+            return folder_config["cache_control"]
+        except ValueError:
+            continue
+    return server.server_config.get("server_settings", {}).get("cache_control", server.DEFAULT_CACHE_CONTROL)
+
+
+def sample_urls(count: int) -> list:
+    """A request mix like the viewer's: scans, voxel files, listings and a few rejected paths."""
+    urls = []
+    for i in range(count):
+        patient = f"PA{i % 50:08d}"
+        urls.append([
+            f"output/{patient}/nifti/scan_{i % 7}.nii.gz",
+            f"output/{patient}/voxels/scan_{i % 7}/label_{i % 120}.nii.gz",
+            f"dicom/{patient}/IM{i % 2000:05d}.dcm",
+            f"output/{patient}/",
+            "../etc/passwd",
+        ][i % 5])
+    return urls
+
+
+def route_legacy(url: str):
+    path = legacy_map_url_to_actual_path(url)
+    return legacy_is_allowed_directory(path), legacy_cache_control_for(path)
+
+
+def route_compiled(url: str):
+    path = server.map_url_to_actual_path(url)
+    return server.is_allowed_directory(path), server.cache_control_for(path)
+
+
+def measure(label: str, route, urls: list):
+    start = time.perf_counter()
+    for url in urls:
+        route(url)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<28} {elapsed / len(urls) * 1e6:>8.2f} µs/request {len(urls) / elapsed:>12,.0f} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image server path routing")
+    parser.add_argument("--requests", type=int, default=200000, help="Lookups per scenario")
+    args = parser.parse_args()
+
+    urls = sample_urls(args.requests)
+    # The security answer must not change; paths are normalized as serve_files does
+    edge_paths = [Path("/"), Path(server.output_folder), Path(server.output_folder + "_sibling"),
+                  Path(server.output_folder) / "dicom" / "x", Path(server.dicom_folder).parent]
+    for url in set(urls):
+        assert legacy_map_url_to_actual_path(url) == server.map_url_to_actual_path(url), url
+        edge_paths.append(Path(os.path.normpath(legacy_map_url_to_actual_path(url))))
+    for path in edge_paths:
+        assert legacy_is_allowed_directory(path) == server.is_allowed_directory(path), path
+        assert legacy_cache_control_for(path) == server.cache_control_for(path), path
+
+    print(f"{len(urls):,} lookups over {len(set(urls)):,} distinct URLs, "
+          f"{len(server.server_config.get('viewable_folders', []))} viewable folders")
+    measure("legacy per-request scans", route_legacy, urls)
+    measure("compiled FolderRoutes", route_compiled, urls)
+
+
+if __name__ == "__main__":
+    main()
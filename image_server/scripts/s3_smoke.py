@@ -0,0 +1,109 @@
+"""
+S3 storage smoke test for the image server.
+
+Uploads a small patient tree to an S3-compatible endpoint (a local MinIO, or
+any stand-in such as ``moto_server``), then checks ``S3Storage`` directly and
+through the HTTP routes: object GET, single byte ranges, 304 revalidation and
+directory listings.
+
+    docker run -d -p 9000:9000 -e MINIO_ROOT_USER=minioadmin \\
+        -e MINIO_ROOT_PASSWORD=minioadmin minio/minio server /data
+    AWS_ACCESS_KEY_ID=minioadmin AWS_SECRET_ACCESS_KEY=minioadmin \\
+        python scripts/s3_smoke.py --endpoint-url http://localhost:9000
+
+Requires the ``s3`` extra: ``pip install '.[s3]'``.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# server.py validates these at import time
+_scratch = tempfile.mkdtemp(prefix="vista3d-s3-smoke-")
+os.environ.setdefault("OUTPUT_FOLDER", _scratch)
+os.environ.setdefault("DICOM_FOLDER", _scratch)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+from storage import S3Storage  # noqa: E402
+
+URL_PATH = "s3smoke"
+
+
+def upload_fixture(client, bucket: str, prefix: str) -> dict:
+    """Create ``bucket`` if needed and upload a scan, two labels and a manifest under ``prefix``."""
+    try:
+        client.create_bucket(Bucket=bucket)
+    except client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    objects = {
+        "P1/nifti/scan.nii.gz": os.urandom(3 * 1024 * 1024 + 17),
+        "P1/voxels/scan/aorta.nii.gz": os.urandom(4096),
+        "P1/voxels/scan/liver.nii.gz": os.urandom(1000),
+        "P1/voxels/scan/manifest.json": b'{"version": 1, "labels": []}',
+    }
+    for key, body in objects.items():
+        client.put_object(Bucket=bucket, Key=f"{prefix}/{key}", Body=body)
+    return objects
+
+
+def check(condition: bool, message: str):
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoint-url", default=os.getenv("S3_ENDPOINT_URL", "http://localhost:9000"))
+    parser.add_argument("--bucket", default="vista3d-smoke")
+    parser.add_argument("--prefix", default="output")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    storage = S3Storage(args.bucket, prefix=args.prefix, endpoint_url=args.endpoint_url)
+    objects = upload_fixture(storage.client, args.bucket, args.prefix)
+    scan = objects["P1/nifti/scan.nii.gz"]
+
+    # Backend API
+    info = storage.stat("P1/nifti/scan.nii.gz")
+    check(info is not None and info.size == len(scan) and not info.is_dir, "stat object")
+    check(storage.stat("P1/voxels").is_dir, "stat prefix as directory")
+    check(storage.stat("P1/missing.nii.gz") is None, "stat missing object")
+    names = [(entry.name, entry.is_dir) for entry in storage.list("P1/voxels/scan")]
+    check(names == [("aorta.nii.gz", False), ("liver.nii.gz", False), ("manifest.json", False)], "list objects")
+    check([entry.name for entry in storage.list("P1") if entry.is_dir] == ["nifti", "voxels"], "list prefixes")
+    body = b"".join(storage.iter_range("P1/nifti/scan.nii.gz", 0, len(scan) - 1, 1024 * 1024))
+    check(body == scan, "get whole object")
+    body = b"".join(storage.iter_range("P1/nifti/scan.nii.gz", 1000, 1999, 256))
+    check(body == scan[1000:2000], "get byte range")
+
+    # HTTP routes, with the bucket mounted as a viewable folder
+    folder_config = {"name": URL_PATH, "url_path": URL_PATH,
+                     "storage": {"driver": "s3", "bucket": args.bucket, "prefix": args.prefix}}
+    server.FOLDER_STORAGE = {**server.FOLDER_STORAGE, URL_PATH: (folder_config, storage)}
+    client = TestClient(server.app)
+    url = f"/{URL_PATH}/P1/nifti/scan.nii.gz"
+
+    response = client.get(url)
+    check(response.status_code == 200 and response.content == scan, "GET object")
+    response = client.get(url, headers={"Range": "bytes=100-4195"})
+    check(response.status_code == 206 and response.content == scan[100:4196]
+          and response.headers["content-range"] == f"bytes 100-4195/{len(scan)}", "GET single range")
+    response = client.get(url, headers={"Range": "bytes=-10"})
+    check(response.status_code == 206 and response.content == scan[-10:], "GET suffix range")
+    etag = client.head(url).headers["etag"]
+    check(client.get(url, headers={"If-None-Match": etag}).status_code == 304, "304 on matching ETag")
+    listing = client.get(f"/{URL_PATH}/P1/voxels/scan/").json()
+    check(sorted(entry["name"] for entry in listing["entries"]) == sorted(
+        ["aorta.nii.gz", "liver.nii.gz", "manifest.json"]), "JSON listing")
+    check(client.get(f"/{URL_PATH}/P1/nope.nii.gz").status_code == 404, "404 for missing object")
+    print("S3 storage smoke test passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,38 @@
 import os
 import argparse
+import signal
+import html
+import fnmatch
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlencode
+from email.utils import formatdate, parsedate_to_datetime
 from fastapi import FastAPI, HTTPException, status, Request, Query
-from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import nibabel as nib
 import numpy as np
 import json
+import io
+import asyncio
+import hashlib
+import struct
 import tempfile
+import zlib
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 
+from storage import LocalStorage, build_storage
+
 load_dotenv()
 
 
@@ -92,29 +111,244 @@ def load_image_server_config():
 
 server_config = load_image_server_config()
 
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+
+class FolderRoutes:
+    """``viewable_folders`` compiled once for per-request URL mapping and access checks.
+
+    URL prefixes are indexed by their first segment, so mapping a URL touches
+    only the folders that could match, in config order. Access checks compare
+    path strings against the precomputed roots and are memoized per resolved
+    path; ``reload`` recompiles the table and drops the memo.
+    """
+
+    def __init__(self, config: dict, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self.reload(config)
+
+    def reload(self, config: dict):
+        folders = config.get("viewable_folders", [])
+        self.url_index = defaultdict(list)
+        for folder_config in folders:
+            folder_url_path = folder_config.get("url_path", folder_config.get("name", ""))
+            self.url_index[folder_url_path.split("/", 1)[0]].append((folder_url_path, Path(folder_config.get("path", ""))))
+        self.fallback_root = Path(output_folder)
+        self.base_roots = tuple(str(Path(folder)) for folder in (output_folder, dicom_folder))
+        self.allowed_roots = tuple(str(Path(folder["path"])) for folder in folders if "path" in folder)
+        self.allowed_url_paths = frozenset(folder["url_path"] for folder in folders if "url_path" in folder)
+        self.cache_control_roots = tuple(
+            (str(Path(folder.get("path", "")).resolve()), folder["cache_control"])
+            for folder in folders if "cache_control" in folder
+        )
+        self.default_cache_control = config.get("server_settings", {}).get("cache_control", DEFAULT_CACHE_CONTROL)
+        self.check = lru_cache(maxsize=self.cache_size)(self._check)
+
+    def map_url(self, url_path: str) -> Path:
+        for folder_url_path, root in self.url_index.get(url_path.split("/", 1)[0], ()):
+            if url_path == folder_url_path:
+                return root
+            if url_path.startswith(folder_url_path + "/"):
+                return root / url_path[len(folder_url_path):].lstrip("/")
+        return self.fallback_root / url_path
+
+    @staticmethod
+    def _within(path: str, root: str) -> bool:
+        return path == root or path.startswith(root if root.endswith(os.sep) else root + os.sep)
+
+    def _check(self, path: str):
+        """(allowed, cache_control) for an already resolved absolute path."""
+        allowed = path in self.base_roots or any(self._within(path, root) for root in self.allowed_roots)
+        if not allowed:
+            for base in self.base_roots:
+                if path.startswith(base + os.sep):
+                    allowed = path[len(base) + 1:].split(os.sep, 1)[0] in self.allowed_url_paths
+                    if allowed:
+                        break
+        cache_control = next(
+            (value for root, value in self.cache_control_roots if self._within(path, root)),
+            self.default_cache_control,
+        )
+        return allowed, cache_control
+
+
+folder_routes = FolderRoutes(server_config)
+
+# Upper bound for recursive JSON listings (?format=json&depth=N)
+MAX_LISTING_DEPTH = 4
+# Entries per HTML listing page (?offset=&limit= override); JSON listings page only when ?limit is given
+LISTING_PAGE_SIZE = int(server_config.get("server_settings", {}).get("listing_page_size", 1000))
+MAX_LISTING_LIMIT = 10000
+# Entries rendered per streamed listing chunk
+LISTING_HTML_CHUNK = 256
+
 
 def calculate_directory_size(directory_path: Path) -> int:
     """Recursively calculate total size of all files in directory and subdirectories."""
-    total_size = 0
+    return directory_size_index.total_size(directory_path)
+
+
+class DirectorySizeIndex:
+    """Cached per-directory file sizes, validated against directory mtimes.
+
+    Each directory record holds the summed size of its own files plus its
+    subdirectory names. A record is reused while the directory's mtime is
+    unchanged, so a subtree total costs one stat per directory rather than one
+    per file. Files overwritten in place do not bump the directory mtime; the
+    pipeline reports those through ``POST /api/notify`` (see ``invalidate``).
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dir-size")
+
+    def _scan(self, directory_path: Path, mtime_ns: int):
+        own_size = 0
+        subdirs = []
+        try:
+            with os.scandir(directory_path) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_file():
+                            own_size += entry.stat().st_size
+                        elif entry.is_dir():
+                            subdirs.append(entry.name)
+                    except (PermissionError, OSError):
+                        # Skip files/directories we can't access
+                        continue
+        except (PermissionError, OSError):
+            pass
+        record = (mtime_ns, own_size, tuple(subdirs))
+        with self._lock:
+            self._records[str(directory_path)] = record
+        return record
+
+    def total_size(self, directory_path: Path) -> int:
+        try:
+            mtime_ns = directory_path.stat().st_mtime_ns
+        except (PermissionError, OSError):
+            return 0
+        record = self._records.get(str(directory_path))
+        if record is None or record[0] != mtime_ns:
+            record = self._scan(directory_path, mtime_ns)
+        total = record[1]
+        for name in record[2]:
+            total += self.total_size(directory_path / name)
+        with self._lock:
+            self._totals[str(directory_path)] = total
+        return total
+
+    def cached_total(self, directory_path: Path):
+        """Return the last computed total (possibly stale) and refresh it in the background."""
+        key = str(directory_path)
+        with self._lock:
+            if key not in self._pending:
+                self._pending.add(key)
+                self._executor.submit(self._refresh, directory_path)
+            return self._totals.get(key)
+
+    def _refresh(self, directory_path: Path):
+        try:
+            self.total_size(directory_path)
+        finally:
+            with self._lock:
+                self._pending.discard(str(directory_path))
+
+    def invalidate(self, path: Path):
+        """Drop cached records for ``path`` (or its parent, for files) and its subtree."""
+        directory = path if path.is_dir() else path.parent
+        prefix = str(directory)
+        with self._lock:
+            for key in [k for k in self._records if k == prefix or k.startswith(prefix + os.sep)]:
+                del self._records[key]
+
+
+directory_size_index = DirectorySizeIndex()
+
+
+def scan_directory_page(directory_path: Path, offset: int = 0, limit: int = None, prefix: str = None,
+                        pattern: str = None) -> dict:
+    """List one page of a directory from a single os.scandir pass.
+
+    Names and types come from the directory read itself, so sorting and
+    counting a 20,000-slice DICOM folder costs no per-file syscalls; only the
+    entries on the requested page are stat'ed. ``prefix`` filters all names,
+    ``pattern`` (an fnmatch glob) files only.
+    """
+    directories = []
+    files = []
     try:
-        for item in directory_path.iterdir():
-            if item.name.startswith('.'):
-                continue
-            try:
-                if item.is_file():
-                    total_size += item.stat().st_size
-                elif item.is_dir():
-                    total_size += calculate_directory_size(item)
-            except (PermissionError, OSError):
-                # Skip files/directories we can't access
-                continue
+        with os.scandir(directory_path) as it:
+            for entry in it:
+                if entry.name.startswith('.') or (prefix and not entry.name.startswith(prefix)):
+                    continue
+                try:
+                    if entry.is_dir():
+                        directories.append((entry.name, True, entry))
+                    elif entry.is_file() and not (pattern and not fnmatch.fnmatch(entry.name, pattern)):
+                        files.append((entry.name, False, entry))
+                except OSError:
+                    continue
     except (PermissionError, OSError):
         pass
-    return total_size
+    directories.sort()
+    files.sort()
+    listed = directories + files
+    stop = len(listed) if limit is None else min(len(listed), offset + limit)
 
+    entries = []
+    for name, is_dir, entry in listed[offset:stop]:
+        try:
+            stat_result = entry.stat()
+        except OSError:
+            continue
+        if is_dir:
+            entries.append({"name": name, "type": "directory", "mtime": stat_result.st_mtime})
+        else:
+            entries.append({"name": name, "type": "file", "size": stat_result.st_size, "mtime": stat_result.st_mtime})
+    return {
+        "entries": entries,
+        "total": len(listed),
+        "directories": len(directories),
+        "files": len(files),
+        "offset": offset,
+        "next_offset": stop if stop < len(listed) else None,
+    }
 
-def generate_directory_listing(directory_path: Path, request_path: str) -> str:
-    items = []
+
+def format_total_size(total_size) -> str:
+    if total_size is None:
+        return "calculating… (refresh to update)"
+    elif total_size < 1024:
+        return f"{total_size} bytes"
+    elif total_size < 1024 * 1024:
+        return f"{total_size / 1024:.1f} KB"
+    elif total_size < 1024 * 1024 * 1024:
+        return f"{total_size / (1024 * 1024):.1f} MB"
+    return f"{total_size / (1024 * 1024 * 1024):.2f} GB"
+
+
+def page_link(request_path: str, offset: int, limit: int, prefix: str = None) -> str:
+    params = {"offset": offset, "limit": limit}
+    if prefix:
+        params["prefix"] = prefix
+    return f"{request_path}?{urlencode(params)}"
+
+
+def listing_total_size(directory_path: Path):
+    """Subtree size shown in HTML listings; None while a background total is pending."""
+    if server_config.get("server_settings", {}).get("async_directory_sizes", False):
+        return directory_size_index.cached_total(directory_path)
+    return calculate_directory_size(directory_path)
+
+
+def generate_directory_listing(request_path: str, page: dict, limit: int, total_size, prefix: str = None):
+    """Yield the HTML listing for one page of a directory in chunks."""
     server_settings = server_config.get("server_settings", {})
     dark_theme = server_settings.get("dark_theme", False)
     
@@ -138,50 +372,13 @@ def generate_directory_listing(directory_path: Path, request_path: str) -> str:
         meta_color = "#666"
         error_color = "#cc0000"
     
-    # Calculate total size (including subdirectories) and counts
-    total_size = calculate_directory_size(directory_path)
-    file_count = 0
-    dir_count = 0
-    
-    try:
-        if request_path != "/":
-            parent_path = str(Path(request_path).parent)
-            if parent_path == ".":
-                parent_path = "/"
-            items.append(f'<li><a href="{parent_path}">📁 ../</a></li>')
-
-        for item in sorted(directory_path.iterdir()):
-            if item.is_dir() and not item.name.startswith('.'):
-                item_name = item.name
-                item_path = f"{request_path.rstrip('/')}/{item_name}/"
-                items.append(f'<li><a href="{item_path}">📁 {item_name}/</a></li>')
-                dir_count += 1
-
-        for item in sorted(directory_path.iterdir()):
-            if item.is_file() and not item.name.startswith('.'):
-                item_name = item.name
-                item_path = f"{request_path.rstrip('/')}/{item_name}"
-                file_size = item.stat().st_size
-                file_count += 1
-                size_str = f"({file_size:,} bytes)" if file_size < 1024*1024 else f"({file_size/(1024*1024):.1f} MB)"
-                items.append(f'<li><a href="{item_path}">📄 {item_name}</a> <span class="meta">{size_str}</span></li>')
-
-    except Exception as e:
-        items.append(f'<li><span class="error">Error reading directory: {e}</span></li>')
-    
-    # Format total size
-    if total_size < 1024:
-        total_size_str = f"{total_size} bytes"
-    elif total_size < 1024 * 1024:
-        total_size_str = f"{total_size / 1024:.1f} KB"
-    elif total_size < 1024 * 1024 * 1024:
-        total_size_str = f"{total_size / (1024 * 1024):.1f} MB"
-    else:
-        total_size_str = f"{total_size / (1024 * 1024 * 1024):.2f} GB"
+    total_size_str = format_total_size(total_size)
 
-    items_html = "\n".join(items)
+    offset = page["offset"]
+    shown = f"{offset + 1}–{offset + len(page['entries'])} of {page['total']}" if page["entries"] else f"0 of {page['total']}"
+    filter_note = f" starting with “{html.escape(prefix)}”" if prefix else ""
 
-    html = f"""
+    yield f"""
     <!DOCTYPE html>
     <html>
     <head>
@@ -205,18 +402,118 @@ def generate_directory_listing(directory_path: Path, request_path: str) -> str:
         <div class="header">
             <h1>📁 Directory listing for {request_path}</h1>
             <p>Image Server - Medical Imaging Files</p>
-            <p class="meta">📊 {file_count} files, {dir_count} directories | Total size (including subdirectories): {total_size_str}</p>
+            <p class="meta">📊 {page['files']} files, {page['directories']} directories{filter_note} | Total size (including subdirectories): {total_size_str}</p>
+            <p class="meta">Showing {shown}</p>
         </div>
         <ul>
-            {items_html}
+"""
+
+    items = []
+    if request_path != "/" and offset == 0:
+        parent_path = str(Path(request_path).parent)
+        if parent_path == ".":
+            parent_path = "/"
+        items.append(f'<li><a href="{parent_path}">📁 ../</a></li>')
+    for entry in page["entries"]:
+        item_name = entry["name"]
+        if entry["type"] == "directory":
+            item_path = f"{request_path.rstrip('/')}/{item_name}/"
+            items.append(f'<li><a href="{item_path}">📁 {item_name}/</a></li>')
+        else:
+            item_path = f"{request_path.rstrip('/')}/{item_name}"
+            file_size = entry["size"]
+            size_str = f"({file_size:,} bytes)" if file_size < 1024*1024 else f"({file_size/(1024*1024):.1f} MB)"
+            items.append(f'<li><a href="{item_path}">📄 {item_name}</a> <span class="meta">{size_str}</span></li>')
+        if len(items) >= LISTING_HTML_CHUNK:
+            yield "\n".join(items) + "\n"
+            items = []
+    if items:
+        yield "\n".join(items) + "\n"
+
+    navigation = []
+    if offset > 0:
+        navigation.append(f'<a href="{page_link(request_path, max(0, offset - limit), limit, prefix)}">← Previous</a>')
+    if page["next_offset"] is not None:
+        navigation.append(f'<a href="{page_link(request_path, page["next_offset"], limit, prefix)}">Next →</a>')
+    navigation_html = f'<p>{" | ".join(navigation)}</p>' if navigation else ""
+
+    yield f"""
         </ul>
+        {navigation_html}
         <div class="footer">
             <p>🩻 Medical Imaging Server | FastAPI + Uvicorn</p>
         </div>
     </body>
     </html>
     """
-    return html
+
+
+def scan_directory_entries(directory_path: Path, depth: int = 1, pattern: str = None) -> list:
+    """List a directory as JSON-ready entries in a single os.scandir pass per level.
+
+    Directories are always included so the tree shape is preserved; ``pattern``
+    (an fnmatch glob) only filters files. Subdirectories are expanded into
+    ``children`` until ``depth`` levels have been listed.
+    """
+    directories = []
+    files = []
+    try:
+        with os.scandir(directory_path) as it:
+            for entry in it:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir():
+                        item = {"name": entry.name, "type": "directory", "mtime": entry.stat().st_mtime}
+                        if depth > 1:
+                            item["children"] = scan_directory_entries(Path(entry.path), depth - 1, pattern)
+                        directories.append(item)
+                    elif entry.is_file():
+                        if pattern and not fnmatch.fnmatch(entry.name, pattern):
+                            continue
+                        stat_result = entry.stat()
+                        files.append({
+                            "name": entry.name,
+                            "type": "file",
+                            "size": stat_result.st_size,
+                            "mtime": stat_result.st_mtime,
+                        })
+                except (PermissionError, OSError):
+                    continue
+    except (PermissionError, OSError):
+        pass
+    directories.sort(key=lambda item: item["name"])
+    files.sort(key=lambda item: item["name"])
+    return directories + files
+
+
+def generate_directory_json(directory_path: Path, request_path: str, depth: int = 1, pattern: str = None) -> dict:
+    return {
+        "path": request_path,
+        "depth": depth,
+        "glob": pattern,
+        "entries": scan_directory_entries(directory_path, depth, pattern),
+    }
+
+
+def iter_directory_json(request_path: str, page: dict, pattern: str = None, prefix: str = None, limit: int = None):
+    """Yield a one-level JSON listing for ``page`` in chunks, entries last."""
+    head = {
+        "path": request_path,
+        "depth": 1,
+        "glob": pattern,
+        "prefix": prefix,
+        "offset": page["offset"],
+        "limit": limit,
+        "total": page["total"],
+        "next_offset": page["next_offset"],
+    }
+    yield json.dumps(head)[:-1] + ', "entries": ['
+    entries = page["entries"]
+    for start in range(0, len(entries), LISTING_HTML_CHUNK):
+        chunk = json.dumps(entries[start:start + LISTING_HTML_CHUNK])[1:-1]
+        yield (", " if start else "") + chunk
+    yield "]}"
 
 
 server_settings = server_config.get("server_settings", {})
@@ -225,6 +522,122 @@ app = FastAPI(
     description=server_settings.get("description", "HTTP server for medical imaging files with directory browsing")
 )
 
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class RequestMetrics:
+    """Counters behind /metrics, rendered in the Prometheus text format.
+
+    Request metrics are only updated from the event loop; stage timings come
+    from worker threads and take a lock.
+    """
+
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.latency = {}
+        self.bytes_sent = defaultdict(int)
+        self.active_range_streams = 0
+        self.stage_seconds = defaultdict(float)
+        self.stage_count = defaultdict(int)
+        self._stage_lock = threading.Lock()
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float, sent: int):
+        self.requests[(method, route, status_code)] += 1
+        self.bytes_sent[route] += sent
+        histogram = self.latency.get(route)
+        if histogram is None:
+            histogram = self.latency[route] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+        histogram[0][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        """Accumulate wall time spent in a processing stage (decode, compress, ...)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stage_lock:
+                self.stage_seconds[name] += elapsed
+                self.stage_count[name] += 1
+
+    def render(self) -> list:
+        lines = ["# TYPE image_server_requests_total counter"]
+        for (method, route, status_code), count in sorted(self.requests.items()):
+            lines.append(f'image_server_requests_total{{method="{method}",route="{route}",status="{status_code}"}} {count}')
+        lines.append("# TYPE image_server_request_duration_seconds histogram")
+        for route, (buckets, total) in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                cumulative += count
+                lines.append(f'image_server_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+            lines.append(f'image_server_request_duration_seconds_sum{{route="{route}"}} {total:.6f}')
+            lines.append(f'image_server_request_duration_seconds_count{{route="{route}"}} {cumulative}')
+        lines.append("# TYPE image_server_response_bytes_total counter")
+        for route, sent in sorted(self.bytes_sent.items()):
+            lines.append(f'image_server_response_bytes_total{{route="{route}"}} {sent}')
+        lines.append("# TYPE image_server_active_range_streams gauge")
+        lines.append(f"image_server_active_range_streams {self.active_range_streams}")
+        lines.append("# TYPE image_server_stage_seconds summary")
+        with self._stage_lock:
+            for name in sorted(self.stage_seconds):
+                lines.append(f'image_server_stage_seconds_sum{{stage="{name}"}} {self.stage_seconds[name]:.6f}')
+                lines.append(f'image_server_stage_seconds_count{{stage="{name}"}} {self.stage_count[name]}')
+        return lines
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware recording per-route counts, latency and bytes sent.
+
+    Latency runs until the last body chunk, so streamed downloads count in
+    full. Routes are labelled by their template (``scope["route"].path``) to
+    keep the label set bounded.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status_code = 500
+        sent = 0
+        content_length = 0
+        range_stream = False
+
+        async def send_with_metrics(message):
+            nonlocal status_code, sent, content_length, range_stream
+            message_type = message["type"]
+            if message_type == "http.response.body":
+                sent += len(message.get("body", b""))
+            elif message_type == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-length":
+                        content_length = int(value)
+                if status_code == 206:
+                    range_stream = True
+                    self.metrics.active_range_streams += 1
+            elif message_type == "http.response.pathsend":
+                sent += content_length
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            if range_stream:
+                self.metrics.active_range_streams -= 1
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.observe_request(scope["method"], route, status_code, time.perf_counter() - start, sent)
+
+
+request_metrics = RequestMetrics()
+app.add_middleware(MetricsMiddleware, metrics=request_metrics)
+
 # Mount assets if present
 assets_dir = Path(__file__).parent / "assets"
 if assets_dir.exists():
@@ -236,143 +649,985 @@ async def health_check():
     return {"status": "healthy", "service": "image-server"}
 
 
+# gzip level for NIfTI produced on the fly (nibabel's default for .nii.gz)
+NIFTI_GZIP_LEVEL = 1
+# Slices per compressed chunk when streaming a volume
+NIFTI_STREAM_SLAB = 8
+
+
+# Seconds an evicted cache file stays on disk for responses that already looked it up
+EVICTION_GRACE_SECONDS = 60
+
+
+class DiskResultCache:
+    """Disk-backed LRU of generated files, bounded by a byte budget.
+
+    Entries are keyed by a digest of the source file identity (resolved path,
+    mtime, size) plus request parameters, so a rewritten source never hits a
+    stale entry. Files surviving a restart are adopted, oldest first.
+
+    Evicted files are unlinked only after ``EVICTION_GRACE_SECONDS``, so a path
+    handed out by ``get`` stays openable while its response starts, and
+    ``building`` lets concurrent misses on one key wait for a single build.
+    """
+
+    def __init__(self, name: str, directory: Path, max_bytes: int):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._building = {}
+        self._retired = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = [p for p in self.directory.iterdir() if p.is_file() and not p.name.startswith('.')]
+        for path in sorted(existing, key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self._entries[path.name] = (path, size)
+            self._bytes += size
+        self._evict()
+        CACHE_REGISTRY[name] = self
+
+    @staticmethod
+    def make_key(source_path: Path, *params, suffix: str = "") -> str:
+        stat_result = source_path.stat()
+        identity = f"{source_path.resolve()}|{stat_result.st_mtime_ns}|{stat_result.st_size}|{params!r}"
+        return hashlib.sha256(identity.encode()).hexdigest() + suffix
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0].exists():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._bytes -= entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    @contextmanager
+    def building(self, key: str):
+        """Serialize builds of ``key``; yields the cached path if another thread built it meanwhile."""
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            try:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    cached_path = entry[0] if entry is not None and entry[0].exists() else None
+                yield cached_path
+            finally:
+                with self._lock:
+                    if self._building.get(key) is build_lock:
+                        del self._building[key]
+
+    def put_stream(self, key: str, chunks) -> Path:
+        """Write ``chunks`` to the cache atomically and return the cached path."""
+        final_path = self.directory / key
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_name, final_path)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        size = final_path.stat().st_size
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (final_path, size)
+            self._bytes += size
+            self._evict(keep=key)
+        return final_path
+
+    def _evict(self, keep: str = None):
+        now = time.monotonic()
+        while self._bytes > self.max_bytes and self._entries:
+            key, (path, size) = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self._bytes -= size
+            self.evictions += 1
+            self._retired.append((now, key, path))
+        while self._retired and now - self._retired[0][0] >= EVICTION_GRACE_SECONDS:
+            _, key, path = self._retired.popleft()
+            if key in self._entries:
+                # Rebuilt under the same name since it was evicted
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+CACHE_REGISTRY = {}
+cache_settings = server_config.get("server_settings", {}).get("filter_cache", {})
+filtered_result_cache = DiskResultCache(
+    "filtered",
+    Path(cache_settings.get("directory") or Path(tempfile.gettempdir()) / "vista3d-image-server" / "filtered"),
+    int(cache_settings.get("max_bytes", 1024 * 1024 * 1024)),
+)
+
+
+class VolumeWorkerPool:
+    """Bounded thread pool for blocking nibabel/numpy/zlib work done by async endpoints.
+
+    At most ``workers`` jobs run at once and ``max_queue`` more may wait; beyond
+    that ``run`` fails fast with 503 so a burst of heavy requests cannot stall
+    the event loop or pile up unbounded. A job is released when its executor
+    future finishes, not when the awaiting request goes away, so a client
+    disconnect cannot free a slot that a worker thread still occupies. The
+    admission counter is only touched from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="volume-worker")
+
+    async def run(self, fn, *args, **kwargs):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy processing volumes, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            future = self._executor.submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        self.in_flight -= 1
+
+
+worker_settings = server_config.get("server_settings", {}).get("worker_pool", {})
+volume_worker_pool = VolumeWorkerPool(
+    int(worker_settings.get("workers") or min(4, os.cpu_count() or 1)),
+    int(worker_settings.get("max_queue", 16)),
+)
+
+
+class DecodedVolumeCache:
+    """In-memory LRU of decoded volumes, bounded by the bytes of their arrays.
+
+    Values are (nifti_img, data) pairs keyed by resolved path, mtime and size;
+    arrays are made read-only because every caller shares them. Concurrent
+    misses on the same key wait for a single decode instead of repeating it,
+    and loading a newer version of a file drops the older one.
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        CACHE_REGISTRY[name] = self
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def get(self, path: Path, loader):
+        stat_result = path.stat()
+        key = (str(path.resolve()), stat_result.st_mtime_ns, stat_result.st_size)
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                value = self._lookup(key)
+                if value is not None:
+                    return value
+                self.misses += 1
+            try:
+                value = loader(path)
+                value[1].flags.writeable = False
+                size = value[1].nbytes
+                with self._lock:
+                    for stale in [k for k in self._entries if k[0] == key[0]]:
+                        self._bytes -= self._entries.pop(stale)[1]
+                    if size <= self.max_bytes:
+                        self._entries[key] = (value, size)
+                        self._bytes += size
+                        self._evict()
+            finally:
+                # Also on failure, so a bad file version does not leave its lock behind
+                with self._lock:
+                    self._loading.pop(key, None)
+        return value
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+decoded_settings = server_config.get("server_settings", {}).get("decoded_cache", {})
+decoded_volume_cache = DecodedVolumeCache("decoded", int(decoded_settings.get("max_bytes", 1024 * 1024 * 1024)))
+
+
+def parse_label_ids(label_ids: str) -> list:
+    return sorted({int(id.strip()) for id in label_ids.split(',') if id.strip()})
+
+
+def decode_label_volume(path: Path):
+    with request_metrics.stage("decode"):
+        nifti_img = nib.load(str(path))
+        data = np.asanyarray(nifti_img.dataobj)
+    if not np.issubdtype(data.dtype, np.integer):
+        # Scaled or float-typed label maps: labels still fit in int16
+        data = np.rint(data).astype(np.int16)
+    return nifti_img, data
+
+
+def load_label_volume(path: Path):
+    """Return (nifti_img, data) for a label map in its native integer dtype.
+
+    Decoded once per file version and shared through ``decoded_volume_cache``;
+    ``data`` is read-only.
+    """
+    return decoded_volume_cache.get(path, decode_label_volume)
+
+
+def filter_labels(data: np.ndarray, label_id_list: list) -> np.ndarray:
+    """Keep only the requested labels in one vectorized pass, preserving dtype."""
+    mask = np.isin(data, label_id_list)
+    filtered_data = np.zeros_like(data)
+    np.copyto(filtered_data, data, where=mask)
+    return filtered_data
+
+
+def iter_nifti_gz(data: np.ndarray, affine, header, compresslevel: int = NIFTI_GZIP_LEVEL):
+    """Yield a gzip-compressed single-file NIfTI for ``data`` without touching disk.
+
+    The header is written first, then the voxel data in Fortran order one slab of
+    slices at a time, so only one slab of uncompressed bytes is alive at once.
+    """
+    nifti_img = nib.Nifti1Image(data, affine, header)
+    out_header = nifti_img.header
+    out_header.set_data_dtype(data.dtype)
+    out_header.set_slope_inter(1.0, 0.0)
+    out_header['vox_offset'] = 0
+    header_io = io.BytesIO()
+    out_header.write_to(header_io)
+    header_bytes = header_io.getvalue()
+    vox_offset = int(out_header['vox_offset'])
+    header_bytes += b'\x00' * (vox_offset - len(header_bytes))
+
+    data_dtype = data.dtype.newbyteorder(out_header.endianness)
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+    yield compressor.compress(header_bytes)
+    if data.ndim == 0:
+        yield compressor.compress(data.astype(data_dtype).tobytes())
+    else:
+        for start in range(0, data.shape[-1], NIFTI_STREAM_SLAB):
+            slab = data[..., start:start + NIFTI_STREAM_SLAB].astype(data_dtype, copy=False)
+            with request_metrics.stage("compress"):
+                chunk = compressor.compress(slab.tobytes(order='F'))
+            if chunk:
+                yield chunk
+    with request_metrics.stage("compress"):
+        tail = compressor.flush()
+    yield tail
+
+
+def resolve_voxels_path(patient_id: str, filename: str) -> Path:
+    voxels_dir = Path(output_folder) / patient_id / "voxels"
+    voxels_path = voxels_dir / filename
+    if not voxels_path.exists():
+        target_stem = Path(filename).stem
+        candidates = []
+        if voxels_dir.exists():
+            for p in voxels_dir.iterdir():
+                if p.is_file() and p.suffix in (".nii", ".gz"):
+                    candidates.append(p)
+        chosen = None
+        for p in candidates:
+            if p.stem == target_stem:
+                chosen = p
+                break
+        if chosen is None and candidates:
+            chosen = candidates[0]
+        if chosen is None:
+            raise HTTPException(status_code=404, detail=f"Voxels file not found: {filename}")
+        voxels_path = chosen
+    return voxels_path
+
+
+def build_filtered_volume(source_path: Path, label_id_list: list, cache_key: str) -> Path:
+    with filtered_result_cache.building(cache_key) as cached_path:
+        if cached_path is not None:
+            return cached_path
+        nifti_img, data = load_label_volume(source_path)
+        filtered_data = filter_labels(data, label_id_list)
+        return filtered_result_cache.put_stream(cache_key, iter_nifti_gz(filtered_data, nifti_img.affine, nifti_img.header))
+
+
+async def filtered_volume_response(request: Request, source_path: Path, label_id_list: list, download_name: str = None):
+    cache_key = DiskResultCache.make_key(source_path, "filter", tuple(label_id_list), suffix=".nii.gz")
+    cached_path = filtered_result_cache.get(cache_key)
+    if cached_path is None:
+        cached_path = await volume_worker_pool.run(build_filtered_volume, source_path, label_id_list, cache_key)
+    return await serve_file_with_range(
+        request,
+        cached_path,
+        extra_headers={"Content-Disposition": f"attachment; filename={download_name}"} if download_name else None,
+        media_type="application/octet-stream",
+    )
+
+
 @app.get("/filtered-scans/{patient_id}/{filename}")
 async def get_filtered_scans(
+    request: Request,
     patient_id: str,
     filename: str,
     label_ids: str = Query(..., description="Comma-separated list of label IDs to include")
 ):
     try:
-        label_id_list = [int(id.strip()) for id in label_ids.split(',') if id.strip()]
+        label_id_list = parse_label_ids(label_ids)
         scan_path = Path(output_folder) / "scans" / patient_id / filename
         if not scan_path.exists():
             raise HTTPException(status_code=404, detail=f"Scan file not found: {filename}")
-        nifti_img = nib.load(str(scan_path))
-        data = nifti_img.get_fdata()
-        filtered_data = np.zeros_like(data)
-        for label_id in label_id_list:
-            filtered_data[data == label_id] = label_id
-        filtered_img = nib.Nifti1Image(filtered_data, nifti_img.affine, nifti_img.header)
-        with tempfile.NamedTemporaryFile(suffix='.nii.gz', delete=False) as tmp_file:
-            nib.save(filtered_img, tmp_file.name)
-            def iter_file():
-                with open(tmp_file.name, 'rb') as f:
-                    while chunk := f.read(8192):
-                        yield chunk
-                os.unlink(tmp_file.name)
-            return StreamingResponse(
-                iter_file(),
-                media_type="application/octet-stream",
-                headers={
-                    "Content-Disposition": f"attachment; filename=filtered_{filename}",
-                    "Access-Control-Allow-Origin": "*"
-                }
-            )
+        return await filtered_volume_response(request, scan_path, label_id_list, f"filtered_{filename}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error filtering segmentation: {str(e)}")
 
 
 @app.get("/filtered-scans/{patient_id}/voxels/{filename}")
 async def get_filtered_voxels(
+    request: Request,
     patient_id: str,
     filename: str,
     label_ids: str = Query(..., description="Comma-separated list of label IDs to include")
 ):
     try:
-        label_id_list = [int(id.strip()) for id in label_ids.split(',') if id.strip()]
-        voxels_dir = Path(output_folder) / patient_id / "voxels"
-        voxels_path = voxels_dir / filename
-        if not voxels_path.exists():
-            target_stem = Path(filename).stem
-            candidates = []
-            if voxels_dir.exists():
-                for p in voxels_dir.iterdir():
-                    if p.is_file() and p.suffix in (".nii", ".gz"):
-                        candidates.append(p)
-            chosen = None
-            for p in candidates:
-                if p.stem == target_stem:
-                    chosen = p
-                    break
-            if chosen is None and candidates:
-                chosen = candidates[0]
-            if chosen is None:
-                raise HTTPException(status_code=404, detail=f"Voxels file not found: {filename}")
-            voxels_path = chosen
-
-        nifti_img = nib.load(str(voxels_path))
-        data = nifti_img.get_fdata()
-        filtered_data = np.zeros_like(data)
-        for label_id in label_id_list:
-            filtered_data[data == label_id] = label_id
-        filtered_img = nib.Nifti1Image(filtered_data, nifti_img.affine, nifti_img.header)
-        with tempfile.NamedTemporaryFile(suffix='.nii.gz', delete=False) as tmp_file:
-            nib.save(filtered_img, tmp_file.name)
-            def iter_file():
-                with open(tmp_file.name, 'rb') as f:
-                    while chunk := f.read(8192):
-                        yield chunk
-                os.unlink(tmp_file.name)
-            return StreamingResponse(
-                iter_file(),
-                media_type="application/octet-stream",
-                headers={
-                    "Content-Disposition": f"attachment; filename=filtered_voxels_{filename}",
-                    "Access-Control-Allow-Origin": "*"
-                }
-            )
+        label_id_list = parse_label_ids(label_ids)
+        voxels_path = resolve_voxels_path(patient_id, filename)
+        return await filtered_volume_response(request, voxels_path, label_id_list, f"filtered_voxels_{filename}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error filtering voxels: {str(e)}")
 
 
-@app.get("/output/{patient_id}/voxels/{filename}/labels")
-async def get_available_voxel_labels(
+# Downsampling factors exposed under /pyramid/{factor}/...; each level is built
+# from the previous one (4x from the cached 2x), so only 2x reductions are needed.
+PYRAMID_FACTORS = (2, 4)
+pyramid_settings = server_config.get("server_settings", {}).get("pyramid_cache", {})
+pyramid_cache = DiskResultCache(
+    "pyramid",
+    Path(pyramid_settings.get("directory") or Path(tempfile.gettempdir()) / "vista3d-image-server" / "pyramid"),
+    int(pyramid_settings.get("max_bytes", 512 * 1024 * 1024)),
+)
+
+
+def is_label_volume(path: Path, data: np.ndarray) -> bool:
+    """Segmentations live under voxels/ and are stored as integers; everything else is intensity."""
+    return "voxels" in path.parts and np.issubdtype(data.dtype, np.integer)
+
+
+def _pad_even(data: np.ndarray) -> np.ndarray:
+    """Edge-pad the three spatial axes to even length so 2x2x2 blocks tile the volume."""
+    pad = [(0, data.shape[axis] % 2) if axis < 3 else (0, 0) for axis in range(data.ndim)]
+    if not any(after for _, after in pad):
+        return data
+    return np.pad(data, pad, mode="edge")
+
+
+def _blocks(slab: np.ndarray) -> np.ndarray:
+    """View a (X, Y, Z, ...) slab with even spatial dims as (X/2, Y/2, Z/2, ..., 8)."""
+    x, y, z = slab.shape[:3]
+    rest = slab.shape[3:]
+    blocks = slab.reshape((x // 2, 2, y // 2, 2, z // 2, 2) + rest)
+    order = (0, 2, 4) + tuple(range(6, 6 + len(rest))) + (1, 3, 5)
+    return blocks.transpose(order).reshape((x // 2, y // 2, z // 2) + rest + (8,))
+
+
+def _mean_blocks(blocks: np.ndarray, dtype) -> np.ndarray:
+    mean = blocks.mean(axis=-1, dtype=np.float32)
+    if np.issubdtype(dtype, np.integer):
+        mean = np.rint(mean)
+    return mean.astype(dtype)
+
+
+def _mode_blocks(blocks: np.ndarray, dtype) -> np.ndarray:
+    # Occurrences of each of the 8 values within its block; ties favour a label
+    # over background so thin structures survive the reduction.
+    counts = (blocks[..., :, None] == blocks[..., None, :]).sum(axis=-1, dtype=np.int8)
+    score = counts * 2 + (blocks != 0)
+    winner = score.argmax(axis=-1)[..., None]
+    return np.take_along_axis(blocks, winner, axis=-1)[..., 0].astype(dtype, copy=False)
+
+
+def downsample2(data: np.ndarray, labels: bool) -> np.ndarray:
+    """Halve the spatial resolution: block mean for intensities, block mode for label maps.
+
+    Works through the volume in z-slabs so the 8-way block view of a full-size
+    scan is never materialized at once.
+    """
+    padded = _pad_even(data)
+    reduce_blocks = _mode_blocks if labels else _mean_blocks
+    out_dtype = data.dtype if np.issubdtype(data.dtype, np.integer) else np.float32
+    x, y, z = padded.shape[:3]
+    out = np.empty((x // 2, y // 2, z // 2) + padded.shape[3:], dtype=out_dtype)
+    step = 2 * NIFTI_STREAM_SLAB
+    for start in range(0, z, step):
+        out[:, :, start // 2:(start + step) // 2] = reduce_blocks(_blocks(padded[:, :, start:start + step]), out_dtype)
+    return out
+
+
+def downsampled_affine(affine: np.ndarray, factor: int) -> np.ndarray:
+    """Affine for a volume reduced by ``factor``: larger voxels centred on the blocks they replace."""
+    out = np.array(affine, dtype=np.float64, copy=True)
+    out[:3, :3] = affine[:3, :3] * factor
+    out[:3, 3] = affine[:3, :3] @ np.full(3, (factor - 1) / 2.0) + affine[:3, 3]
+    return out
+
+
+def build_pyramid_level(source_path: Path, factor: int) -> Path:
+    """Return the cached ``factor``x level of ``source_path``, building lower levels as needed."""
+    cache_key = DiskResultCache.make_key(source_path, "pyramid", factor, suffix=".nii.gz")
+    cached_path = pyramid_cache.get(cache_key)
+    if cached_path is not None:
+        return cached_path
+
+    with pyramid_cache.building(cache_key) as cached_path:
+        if cached_path is not None:
+            return cached_path
+        parent_path = source_path if factor == 2 else build_pyramid_level(source_path, factor // 2)
+        with request_metrics.stage("decode"):
+            nifti_img = nib.load(str(parent_path))
+            data = np.asanyarray(nifti_img.dataobj)
+        reduced = downsample2(data, is_label_volume(source_path, data))
+        affine = downsampled_affine(nifti_img.affine, 2)
+        header = nifti_img.header.copy()
+        header.set_zooms(tuple(z * 2 if axis < 3 else z for axis, z in enumerate(header.get_zooms())))
+        header.set_qform(affine)
+        header.set_sform(affine)
+        return pyramid_cache.put_stream(cache_key, iter_nifti_gz(reduced, affine, header))
+
+
+def resolve_pyramid_source(full_path: str) -> Path:
+    """Map a served NIfTI URL path to its file; ``x.nii.gz`` also finds an uncompressed ``x.nii``."""
+    absolute_path = map_url_to_actual_path(full_path).resolve()
+    if not is_allowed_directory(absolute_path):
+        raise HTTPException(status_code=403, detail="Access denied - only configured folders are accessible")
+    if not absolute_path.is_file() and absolute_path.name.endswith(".nii.gz"):
+        absolute_path = absolute_path.with_name(absolute_path.name[:-len(".gz")])
+    if not absolute_path.is_file() or not absolute_path.name.endswith((".nii", ".nii.gz")):
+        raise HTTPException(status_code=404, detail="NIfTI file not found")
+    return absolute_path
+
+
+@app.get("/pyramid/{factor}/{full_path:path}")
+@app.head("/pyramid/{factor}/{full_path:path}")
+async def get_pyramid_level(request: Request, factor: int, full_path: str):
+    """Serve ``full_path`` downsampled by ``factor`` as a gzip NIfTI, built on first request."""
+    if factor not in PYRAMID_FACTORS:
+        raise HTTPException(status_code=404, detail=f"Pyramid factor must be one of {list(PYRAMID_FACTORS)}")
+    source_path = resolve_pyramid_source(full_path)
+    try:
+        level_path = await volume_worker_pool.run(build_pyramid_level, source_path, factor)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building pyramid level: {str(e)}")
+    return await serve_file_with_range(request, level_path, media_type="application/octet-stream")
+
+
+# Decompressed copies of .nii.gz volumes, memory-mapped so a slice read only
+# touches the pages that hold it.
+uncompressed_settings = server_config.get("server_settings", {}).get("uncompressed_cache", {})
+uncompressed_cache = DiskResultCache(
+    "uncompressed",
+    Path(uncompressed_settings.get("directory") or Path(tempfile.gettempdir()) / "vista3d-image-server" / "uncompressed"),
+    int(uncompressed_settings.get("max_bytes", 4 * 1024 * 1024 * 1024)),
+)
+SLICE_AXES = {"x": 0, "y": 1, "z": 2}
+
+
+def open_mmap_volume(source_path: Path):
+    """Open ``source_path`` memory-mapped, via its cached uncompressed copy for .nii.gz."""
+    if source_path.suffix == ".nii":
+        return nib.load(str(source_path), mmap=True)
+    cache_key = DiskResultCache.make_key(source_path, "uncompressed", suffix=".nii")
+    cached_path = uncompressed_cache.get(cache_key)
+    if cached_path is None:
+        with uncompressed_cache.building(cache_key) as cached_path:
+            if cached_path is None:
+                cached_path = uncompressed_cache.put_stream(cache_key, iter_gunzip(source_path))
+    return nib.load(str(cached_path), mmap=True)
+
+
+def read_slice(nifti_img, axis: int, index: int) -> np.ndarray:
+    """Read one 2D slice (first volume of 4D data) through the image's array proxy."""
+    shape = nifti_img.shape
+    if not 0 <= index < shape[axis]:
+        raise HTTPException(status_code=400, detail=f"index must be in [0, {shape[axis]}) for this axis")
+    slicer = [slice(None)] * 3 + [0] * (len(shape) - 3)
+    slicer[axis] = index
+    return np.asanyarray(nifti_img.dataobj[tuple(slicer)])
+
+
+def read_scan_slice(scan_path: Path, axis: int, index: int = None) -> np.ndarray:
+    nifti_img = open_mmap_volume(scan_path)
+    return read_slice(nifti_img, axis, nifti_img.shape[axis] // 2 if index is None else index)
+
+
+def parse_window(window: str, pixels: np.ndarray):
+    """``center,width`` → (low, high); defaults to the slice's own range."""
+    if not window:
+        return float(pixels.min()), float(pixels.max())
+    try:
+        center, width = (float(v) for v in window.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="window must be 'center,width'")
+    return center - width / 2, center + width / 2
+
+
+def encode_png_gray8(pixels: np.ndarray) -> bytes:
+    """Encode a 2D uint8 array as an 8-bit grayscale PNG."""
+    height, width = pixels.shape
+    scanlines = np.zeros((height, width + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def render_slice_png(pixels: np.ndarray, low: float, high: float) -> bytes:
+    # Display orientation: first voxel axis left to right, second bottom to top
+    scaled = (pixels.astype(np.float32) - low) * (255.0 / max(high - low, 1e-6))
+    return encode_png_gray8(np.flipud(np.clip(scaled, 0, 255).astype(np.uint8).T))
+
+
+def resolve_scan_nifti_path(patient_id: str, filename: str) -> Path:
+    nifti_dir = Path(output_folder) / patient_id / "nifti"
+    for candidate in (filename, f"{filename}.nii.gz", f"{filename}.nii"):
+        path = nifti_dir / candidate
+        if path.is_file() and path.name.endswith((".nii", ".nii.gz")):
+            return path
+    raise HTTPException(status_code=404, detail=f"Scan file not found: {filename}")
+
+
+@app.get("/slice/{patient_id}/{filename}")
+async def get_scan_slice(
+    request: Request,
     patient_id: str,
     filename: str,
+    axis: str = Query("z", pattern="^[xyz]$", description="Slice axis in voxel space"),
+    index: int = Query(None, description="Slice index along axis; defaults to the middle slice"),
+    window: str = Query(None, description="Display window as 'center,width' (PNG only)"),
+    format: str = Query("png", pattern="^(png|raw)$", description="png, or raw native-dtype voxels"),
 ):
+    """One slice of a scan as PNG, or raw voxels with X-Slice-Shape/X-Slice-Dtype headers."""
+    scan_path = resolve_scan_nifti_path(patient_id, filename)
+    scan_stat = scan_path.stat()
+    etag = '"{}-{}"'.format(file_etag(scan_stat).strip('"'), hashlib.sha1(
+        f"{axis}|{index}|{window}|{format}".encode()).hexdigest()[:12])
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(scan_stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control_for(scan_path),
+        "Access-Control-Allow-Origin": "*",
+    }
+    if is_not_modified(request, etag, scan_stat.st_mtime):
+        return not_modified_response(headers)
     try:
-        voxels_dir = Path(output_folder) / patient_id / "voxels"
-        voxels_path = voxels_dir / filename
-        if not voxels_path.exists():
-            target_stem = Path(filename).stem
-            candidates = []
-            if voxels_dir.exists():
-                for p in voxels_dir.iterdir():
-                    if p.is_file() and p.suffix in (".nii", ".gz"):
-                        candidates.append(p)
-            chosen = None
-            for p in candidates:
-                if p.stem == target_stem:
-                    chosen = p
-                    break
-            if chosen is None and candidates:
-                chosen = candidates[0]
-            if chosen is None:
-                raise HTTPException(status_code=404, detail=f"Voxels file not found: {filename}")
-            voxels_path = chosen
-
-        nifti_img = nib.load(str(voxels_path))
-        data = nifti_img.get_fdata()
-        unique_vals = np.unique(data.astype(np.int32))
-        label_ids = [int(v) for v in unique_vals if int(v) != 0]
-
-        id_to_name = {}
-        try:
-            colors_path = Path(__file__).parent / ".." / "conf" / "vista3d_label_colors.json"
-            colors_path = colors_path.resolve()
-            if colors_path.exists():
-                with open(colors_path, 'r') as f:
+        pixels = await volume_worker_pool.run(read_scan_slice, scan_path, SLICE_AXES[axis], index)
+        if format == "raw":
+            headers["X-Slice-Shape"] = ",".join(str(n) for n in pixels.shape)
+            headers["X-Slice-Dtype"] = pixels.dtype.str
+            return Response(content=np.ascontiguousarray(pixels).tobytes(), media_type="application/octet-stream", headers=headers)
+        low, high = parse_window(window, pixels)
+        png = await volume_worker_pool.run(render_slice_png, pixels, low, high)
+        return Response(content=png, media_type="image/png", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading slice: {str(e)}")
+
+
+LABEL_MANIFEST_FILENAME = "manifest.json"
+# Parsed manifests and label store indexes kept in memory, per file version
+LABEL_METADATA_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=1)
+def load_label_names() -> dict:
+    """Map label IDs to names from vista3d_label_colors.json, read once per process.
+
+    The file is the frontend's conf/vista3d_label_colors.json: read in place in a
+    source checkout, copied into the image at build time, or mounted and named
+    by LABEL_COLORS_PATH.
+    """
+    script_dir = Path(__file__).parent
+    candidates = [
+        os.getenv("LABEL_COLORS_PATH"),
+        script_dir.parent / "frontend" / "conf" / "vista3d_label_colors.json",
+        script_dir / "conf" / "vista3d_label_colors.json",
+    ]
+    for candidate in candidates:
+        if candidate and Path(candidate).exists():
+            try:
+                with open(candidate, 'r') as f:
                     items = json.load(f)
-                for item in items:
-                    iid = int(item.get('id', -1))
-                    name = item.get('name', '')
-                    if iid >= 0:
-                        id_to_name[iid] = name
-        except Exception:
+                return {int(item['id']): item.get('name', '') for item in items if int(item.get('id', -1)) >= 0}
+            except Exception as e:
+                print(f"Warning: Could not load label names from {candidate}: {e}")
+    return {}
+
+
+def label_filename(label_name: str) -> str:
+    return label_name.lower().replace(' ', '_').replace('-', '_') + '.nii.gz'
+
+
+def summarize_labels(data: np.ndarray) -> list:
+    """Voxel counts and [start, stop) bounding boxes for every non-zero label.
+
+    Each axis is swept once with a per-slice bincount, so the cost is a few
+    passes over the volume regardless of how many labels it contains.
+    """
+    if data.size == 0:
+        return []
+    if data.min() < 0:
+        data = np.where(data < 0, 0, data)
+    n_bins = int(data.max()) + 1
+    counts = None
+    presence = []
+    for axis in range(data.ndim):
+        moved = np.moveaxis(data, axis, 0)
+        present = np.zeros((moved.shape[0], n_bins), dtype=bool)
+        axis_counts = np.zeros(n_bins, dtype=np.int64)
+        for index in range(moved.shape[0]):
+            slice_counts = np.bincount(moved[index].ravel(), minlength=n_bins)
+            present[index] = slice_counts > 0
+            axis_counts += slice_counts
+        counts = axis_counts if counts is None else counts
+        presence.append(present)
+
+    summary = []
+    for label_id in np.flatnonzero(counts):
+        if label_id == 0:
+            continue
+        bbox = []
+        for present in presence:
+            indices = np.flatnonzero(present[:, label_id])
+            bbox.append([int(indices[0]), int(indices[-1]) + 1])
+        summary.append({"id": int(label_id), "voxel_count": int(counts[label_id]), "bbox": bbox})
+    return summary
+
+
+def compute_label_manifest(segmentation_path: Path, scan_dir: Path = None) -> dict:
+    """Build a manifest for outputs written before segment.py produced one."""
+    nifti_img, data = load_label_volume(segmentation_path)
+    id_to_name = load_label_names()
+    labels = []
+    for entry in summarize_labels(data):
+        name = id_to_name.get(entry["id"], str(entry["id"]))
+        filename = label_filename(name) if entry["id"] in id_to_name else None
+        if scan_dir is None or filename is None or not (scan_dir / filename).exists():
+            filename = None
+        labels.append({"id": entry["id"], "name": name, "voxel_count": entry["voxel_count"],
+                       "bbox": entry["bbox"], "filename": filename})
+    return {
+        "version": 1,
+        "segmentation": segmentation_path.name,
+        "shape": [int(n) for n in nifti_img.shape],
+        "affine": nifti_img.affine.tolist(),
+        "labels": labels,
+    }
+
+
+def load_label_manifest(scan_dir: Path = None, segmentation_path: Path = None):
+    """Return (manifest, source) for a scan's voxels folder or a single label file.
+
+    manifest.json written by segment.py is preferred; otherwise the manifest is
+    computed from the segmentation once, kept in memory keyed by path and
+    mtime, and persisted next to it when the folder is writable.
+    """
+    if scan_dir is not None:
+        manifest_path = scan_dir / LABEL_MANIFEST_FILENAME
+        if manifest_path.exists():
+            return read_label_manifest(str(manifest_path), manifest_path.stat().st_mtime_ns), "manifest"
+        segmentation_path = scan_dir / "all.nii.gz"
+        if not segmentation_path.exists():
+            raise HTTPException(status_code=404, detail=f"Segmentation not found in {scan_dir.name}")
+
+    return cached_computed_manifest(str(segmentation_path), segmentation_path.stat().st_mtime_ns,
+                                    str(scan_dir) if scan_dir is not None else None), "computed"
+
+
+@lru_cache(maxsize=LABEL_METADATA_CACHE_SIZE)
+def read_label_manifest(manifest_path: str, mtime_ns: int) -> dict:
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=LABEL_METADATA_CACHE_SIZE)
+def cached_computed_manifest(segmentation_path: str, mtime_ns: int, scan_dir: str = None) -> dict:
+    scan_dir = Path(scan_dir) if scan_dir is not None else None
+    manifest = compute_label_manifest(Path(segmentation_path), scan_dir)
+    if scan_dir is not None:
+        try:
+            with open(scan_dir / LABEL_MANIFEST_FILENAME, 'w') as f:
+                json.dump(manifest, f, indent=2)
+        except OSError:
+            # Output folder is mounted read-only in the container
             pass
+    return manifest
+
+
+def resolve_scan_voxels_dir(patient_id: str, filename: str):
+    """Map a scan name (with or without .nii/.nii.gz) to output/{patient}/voxels/{scan}/."""
+    voxels_dir = Path(output_folder) / patient_id / "voxels"
+    for name in (filename, filename.replace('.nii.gz', '').replace('.nii', '')):
+        candidate = voxels_dir / name
+        if candidate.is_dir():
+            return candidate
+    return None
+
+
+# Packed per-scan label store written by segment.py (VOXEL_STORE=packed) in place
+# of one full-size NIfTI per label. Layout: 8-byte magic, little-endian uint64
+# index length, JSON index, then each label's bounding-box crop as a bit-packed
+# mask (C order, little bit order) at the index's byte offset into the payload.
+LABEL_STORE_FILENAME = "labels.vxmask"
+LABEL_STORE_MAGIC = b"VXMASK01"
+
+
+def load_label_store_index(store_path: Path) -> dict:
+    return read_label_store_index(str(store_path), store_path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=LABEL_METADATA_CACHE_SIZE)
+def read_label_store_index(store_path: str, mtime_ns: int) -> dict:
+    with open(store_path, "rb") as f:
+        if f.read(len(LABEL_STORE_MAGIC)) != LABEL_STORE_MAGIC:
+            raise ValueError(f"{Path(store_path).name} is not a label store")
+        (index_length,) = struct.unpack("<Q", f.read(8))
+        index = json.loads(f.read(index_length))
+    index["payload_offset"] = len(LABEL_STORE_MAGIC) + 8 + index_length
+    index["by_filename"] = {entry["filename"]: entry for entry in index["labels"] if entry.get("filename")}
+    return index
+
 
-        labels = [{"id": lid, "name": id_to_name.get(lid, str(lid))} for lid in label_ids]
-        return {"labels": labels, "voxel_filename": voxels_path.name}
+def expand_store_label(store_path: Path, filename: str, cropped: bool = False):
+    """Rebuild one label's int16 volume (label ID inside, 0 outside) and its affine.
+
+    ``cropped`` returns just the bounding box, with the affine origin moved to
+    the box's first voxel so it still lands in the same place in world space.
+    """
+    index = load_label_store_index(store_path)
+    entry = index["by_filename"][filename]
+    bbox = [slice(start, stop) for start, stop in entry["bbox"]]
+    crop_shape = tuple(s.stop - s.start for s in bbox)
+    with open(store_path, "rb") as f:
+        f.seek(index["payload_offset"] + entry["offset"])
+        packed = np.frombuffer(f.read(entry["nbytes"]), dtype=np.uint8)
+    mask = np.unpackbits(packed, count=int(np.prod(crop_shape)), bitorder="little").reshape(crop_shape).astype(bool)
+
+    affine = np.array(index["affine"], dtype=np.float64)
+    if cropped:
+        data = np.zeros(crop_shape, dtype=np.int16)
+        data[mask] = entry["id"]
+        affine[:3, 3] = affine[:3, :3] @ np.array([s.start for s in bbox]) + affine[:3, 3]
+        return data, affine
+    data = np.zeros(tuple(index["shape"]), dtype=np.int16)
+    data[tuple(bbox)][mask] = entry["id"]
+    return data, affine
+
+
+def build_store_label(store_path: Path, filename: str, cropped: bool, cache_key: str) -> Path:
+    with filtered_result_cache.building(cache_key) as cached_path:
+        if cached_path is not None:
+            return cached_path
+        data, affine = expand_store_label(store_path, filename, cropped)
+        return filtered_result_cache.put_stream(cache_key, iter_nifti_gz(data, affine, None))
+
+
+async def store_label_path(request: Request, store_path: Path, filename: str) -> Path:
+    """Cached ``.nii.gz`` of one label expanded from the packed store; ``?crop=1`` keeps the bounding box only."""
+    try:
+        if filename not in load_label_store_index(store_path)["by_filename"]:
+            raise HTTPException(status_code=404, detail="Not found")
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=500, detail=f"Error reading label store: {str(e)}")
+    cropped = request.query_params.get("crop") == "1"
+    cache_key = DiskResultCache.make_key(store_path, "store-label", filename, cropped, suffix=".nii.gz")
+    cached_path = filtered_result_cache.get(cache_key)
+    if cached_path is None:
+        cached_path = await volume_worker_pool.run(build_store_label, store_path, filename, cropped, cache_key)
+    return cached_path
+
+
+async def serve_store_label(request: Request, store_path: Path, filename: str):
+    """Serve a per-label NIfTI URL from the packed store."""
+    cached_path = await store_label_path(request, store_path, filename)
+    return await serve_file_with_range(request, cached_path, media_type="application/octet-stream")
+
+
+def iter_label_store(shape, affine, labels: list, crops: list):
+    """Yield a label store (same layout as labels.vxmask) for ``labels`` and their boolean crops."""
+    index_labels = []
+    payload = []
+    offset = 0
+    for entry, crop in zip(labels, crops):
+        bits = np.packbits(crop.ravel(), bitorder="little")
+        index_labels.append({**entry, "offset": offset, "nbytes": int(bits.nbytes)})
+        payload.append(bits)
+        offset += bits.nbytes
+    index = json.dumps({
+        "version": 1,
+        "shape": [int(n) for n in shape[:3]],
+        "affine": np.asarray(affine).tolist(),
+        "labels": index_labels,
+    }).encode("utf-8")
+    yield LABEL_STORE_MAGIC + struct.pack("<Q", len(index)) + index
+    for bits in payload:
+        yield bits.tobytes()
+
+
+def build_label_parts(scan_dir: Path, label_id_list: list, cache_key: str) -> Path:
+    """Cache the bounding-box crops of the requested labels as one packed multi-part payload.
+
+    Boxes come from the scan's label manifest, so each label is only compared
+    against the segmentation inside its own box.
+    """
+    with filtered_result_cache.building(cache_key) as cached_path:
+        if cached_path is not None:
+            return cached_path
+        manifest, _ = load_label_manifest(scan_dir=scan_dir)
+        nifti_img, data = load_label_volume(scan_dir / "all.nii.gz")
+        wanted = set(label_id_list)
+        labels = []
+        crops = []
+        for entry in manifest.get("labels", []):
+            if entry["id"] not in wanted:
+                continue
+            bbox = tuple(slice(start, stop) for start, stop in entry["bbox"])
+            labels.append({"id": entry["id"], "name": entry.get("name"), "bbox": entry["bbox"]})
+            crops.append(data[bbox] == entry["id"])
+        return filtered_result_cache.put_stream(cache_key, iter_label_store(data.shape, nifti_img.affine, labels, crops))
+
+
+@app.get("/batch/{patient_id}/{scan_name}/{selection}")
+@app.head("/batch/{patient_id}/{scan_name}/{selection}")
+async def get_label_batch(request: Request, patient_id: str, scan_name: str, selection: str):
+    """Many labels of a scan in one response; ``selection`` is comma-separated IDs plus a format suffix.
+
+    ``1,5,6.nii.gz`` returns one composed label volume containing only those
+    labels; ``1,5,6.vxmask`` returns their bit-packed bounding-box crops behind
+    a JSON index, in the labels.vxmask layout.
+    """
+    for suffix in (".nii.gz", ".vxmask"):
+        if selection.endswith(suffix):
+            break
+    else:
+        raise HTTPException(status_code=404, detail="Batch selection must end in .nii.gz or .vxmask")
+    try:
+        label_id_list = parse_label_ids(selection[:-len(suffix)])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Label IDs must be comma-separated integers")
+    if not label_id_list:
+        raise HTTPException(status_code=400, detail="No label IDs given")
+    scan_dir = resolve_scan_voxels_dir(patient_id, scan_name)
+    segmentation_path = scan_dir / "all.nii.gz" if scan_dir is not None else None
+    if segmentation_path is None or not segmentation_path.is_file():
+        raise HTTPException(status_code=404, detail=f"Segmentation not found for {scan_name}")
+
+    if suffix == ".nii.gz":
+        return await filtered_volume_response(request, segmentation_path, label_id_list)
+    cache_key = DiskResultCache.make_key(segmentation_path, "parts", tuple(label_id_list), suffix=".vxmask")
+    cached_path = filtered_result_cache.get(cache_key)
+    if cached_path is None:
+        cached_path = await volume_worker_pool.run(build_label_parts, scan_dir, label_id_list, cache_key)
+    return await serve_file_with_range(request, cached_path, media_type="application/octet-stream")
+
+
+@app.get("/output/{patient_id}/voxels/{filename}/labels")
+async def get_available_voxel_labels(
+    patient_id: str,
+    filename: str,
+):
+    try:
+        scan_dir = resolve_scan_voxels_dir(patient_id, filename)
+        if scan_dir is not None:
+            manifest, source = await volume_worker_pool.run(load_label_manifest, scan_dir=scan_dir)
+        else:
+            manifest, source = await volume_worker_pool.run(
+                load_label_manifest, segmentation_path=resolve_voxels_path(patient_id, filename)
+            )
+        return {
+            "labels": manifest.get("labels", []),
+            "voxel_filename": manifest.get("segmentation"),
+            "source": source,
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -381,29 +1636,7 @@ async def get_available_voxel_labels(
 
 def is_allowed_directory(path: Path) -> bool:
     try:
-        allowed_folder_paths = [Path(folder["path"]) for folder in server_config.get("viewable_folders", [])]
-        if path == Path(output_folder) or path == Path(dicom_folder):
-            return True
-        for allowed_path in allowed_folder_paths:
-            try:
-                path.relative_to(allowed_path)
-                return True
-            except ValueError:
-                continue
-        try:
-            for base_folder in [Path(output_folder), Path(dicom_folder)]:
-                try:
-                    rel_path = path.relative_to(base_folder)
-                    path_parts = rel_path.parts
-                    if path_parts:
-                        allowed_url_paths = [folder["url_path"] for folder in server_config.get("viewable_folders", [])]
-                        if path_parts[0] in allowed_url_paths:
-                            return True
-                except ValueError:
-                    continue
-        except ValueError:
-            pass
-        return False
+        return folder_routes.check(str(path))[0]
     except Exception:
         return False
 
@@ -484,23 +1717,332 @@ def generate_restricted_root_listing() -> HTMLResponse:
     return HTMLResponse(content=html, status_code=200)
 
 
+def map_url_to_actual_path(url_path: str) -> Path:
+    return folder_routes.map_url(url_path)
+
+
+# Storage backend per viewable folder url_path. Local folders keep the
+# Path-based serving below; other drivers go through serve_from_storage.
+FOLDER_STORAGE = {
+    folder_config.get("url_path", folder_config.get("name", "")): (folder_config, build_storage(folder_config))
+    for folder_config in server_config.get("viewable_folders", [])
+}
+
+
+def reload_server_config(*_):
+    """Re-read conf/image_server_conf.json (on SIGHUP) and recompile the folder routing table.
+
+    The new tables are built aside and the globals rebound, never mutated, so
+    a request iterating the old ones when the signal lands is unaffected.
+    """
+    global server_config, folder_routes, FOLDER_STORAGE
+    config = load_image_server_config()
+    routes = FolderRoutes(config, folder_routes.cache_size)
+    storage = {
+        folder_config.get("url_path", folder_config.get("name", "")): (folder_config, build_storage(folder_config))
+        for folder_config in config.get("viewable_folders", [])
+    }
+    server_config, folder_routes, FOLDER_STORAGE = config, routes, storage
+    print("Reloaded image server config")
+
+
+if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGHUP, reload_server_config)
+
+
+def resolve_storage(url_path: str):
+    """Return (folder_config, backend, key) for the folder serving ``url_path``, or None."""
+    for folder_url_path, (folder_config, backend) in FOLDER_STORAGE.items():
+        if url_path == folder_url_path or url_path.startswith(folder_url_path + "/"):
+            return folder_config, backend, url_path[len(folder_url_path):].strip("/")
+    return None
+
+
+def classify_change(url_path: str, is_dir: bool) -> dict:
+    """Describe a changed output path: which patient/scan it belongs to and what kind of result it is."""
+    parts = url_path.split("/")
+    change = {"kind": "directory" if is_dir else "file", "patient_id": parts[1] if len(parts) > 1 else None}
+    if len(parts) == 2 and is_dir:
+        change["kind"] = "patient"
+    elif len(parts) >= 4 and parts[2] == "nifti":
+        change["kind"] = "scan"
+        change["scan"] = parts[3]
+    elif len(parts) >= 4 and parts[2] == "voxels":
+        change["scan"] = parts[3]
+        change["kind"] = "voxels" if len(parts) > 4 and parts[4] not in ("all.nii.gz", LABEL_STORE_FILENAME, "manifest.json") else "segmentation"
+    elif len(parts) >= 4 and parts[2] == "ply":
+        change["kind"] = "mesh"
+        change["scan"] = parts[3]
+    return change
+
+
+class ChangeFeed:
+    """Filesystem change events for the watched folders, fanned out to /api/events subscribers.
+
+    While anyone is subscribed, the watched trees are polled with scandir. Like
+    ``DirectorySizeIndex``, a directory is only re-read when its mtime moves, so
+    a poll costs one stat per directory. A changed path is held back until its
+    size and mtime have been stable for ``debounce`` seconds, so a file being
+    written yields one event once it is complete. Paths reported through
+    ``POST /api/notify`` are published immediately. Recent events are kept so a
+    reconnecting client can resume from ``Last-Event-ID``.
+    """
+
+    def __init__(self, folders: list, poll_interval: float = 1.0, debounce: float = 2.0,
+                 max_depth: int = 4, history: int = 1000):
+        self.folders = folders
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.max_depth = max_depth
+        self.history = deque(maxlen=history)
+        self.last_id = 0
+        self.subscribers = set()
+        self._dirs = None
+        self._pending = {}
+        self._task = None
+
+    def _roots(self):
+        for url_path in self.folders:
+            storage_target = FOLDER_STORAGE.get(url_path)
+            if storage_target is not None and isinstance(storage_target[1], LocalStorage):
+                yield url_path, storage_target[1].root
+
+    def _scan_tree(self, root: Path, url_path: str, depth: int, dirs: dict):
+        try:
+            mtime_ns = os.stat(root).st_mtime_ns
+        except OSError:
+            return
+        previous = self._dirs.get(url_path) if self._dirs else None
+        if previous is not None and previous[0] == mtime_ns:
+            entries = previous[1]
+        else:
+            entries = {}
+            try:
+                with os.scandir(root) as it:
+                    for entry in it:
+                        if entry.name.startswith("."):
+                            continue
+                        try:
+                            st = entry.stat()
+                            entries[entry.name] = (entry.is_dir(), st.st_size, st.st_mtime_ns)
+                        except OSError:
+                            continue
+            except OSError:
+                pass
+        dirs[url_path] = (mtime_ns, entries)
+        if depth < self.max_depth:
+            for name, (is_dir, _, _) in entries.items():
+                if is_dir:
+                    self._scan_tree(root / name, f"{url_path}/{name}", depth + 1, dirs)
+
+    def poll(self) -> list:
+        """Rescan the watched trees and return the changes that have settled since the last poll."""
+        dirs = {}
+        for url_path, root in self._roots():
+            self._scan_tree(root, url_path, 0, dirs)
+        now = time.monotonic()
+        if self._dirs is not None:
+            for dir_path, (_, entries) in dirs.items():
+                previous = self._dirs.get(dir_path, (None, {}))[1]
+                if previous is entries:
+                    continue
+                for name in previous.keys() | entries.keys():
+                    before, after = previous.get(name), entries.get(name)
+                    if before == after or (before and after and before[0] and after[0]):
+                        continue
+                    action = "created" if before is None else "deleted" if after is None else "modified"
+                    self._mark(f"{dir_path}/{name}", action, (after or before)[0], after, now)
+        self._dirs = dirs
+
+        # Re-stat held-back files: writes in progress change size without touching the directory
+        settled = []
+        for path, (action, is_dir, signature, changed_at) in list(self._pending.items()):
+            if action != "deleted" and not is_dir:
+                try:
+                    st = map_url_to_actual_path(path).stat()
+                    current = (False, st.st_size, st.st_mtime_ns)
+                except OSError:
+                    current = None
+                if current != signature:
+                    self._pending[path] = (action, is_dir, current, now)
+                    continue
+            if now - changed_at >= self.debounce:
+                del self._pending[path]
+                settled.append((path, action, is_dir))
+        return settled
+
+    def _mark(self, path: str, action: str, is_dir: bool, signature, now: float):
+        pending = self._pending.get(path)
+        if pending is not None:
+            if pending[0] == "created" and action == "deleted":
+                del self._pending[path]
+                return
+            if pending[0] == "created" or (pending[0] == "deleted" and action == "created"):
+                action = "created" if pending[0] == "created" else "modified"
+        self._pending[path] = (action, is_dir, signature, now)
+
+    def publish(self, path: str, action: str, is_dir: bool):
+        self.last_id += 1
+        event = {"id": self.last_id, "action": action, "path": path, "time": time.time(), **classify_change(path, is_dir)}
+        self.history.append(event)
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind: tell the client to re-list instead of buffering more
+                queue.overflowed = True
+
+    def subscribe(self, last_event_id: int = None):
+        """Register a subscriber; returns (queue, replay events, whether the client must re-list)."""
+        queue = asyncio.Queue(maxsize=256)
+        queue.overflowed = False
+        self.subscribers.add(queue)
+        replay, reset = [], False
+        if last_event_id is not None:
+            oldest = self.history[0]["id"] if self.history else self.last_id + 1
+            reset = last_event_id > self.last_id or last_event_id < oldest - 1
+            if not reset:
+                replay = [event for event in self.history if event["id"] > last_event_id]
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue, replay, reset
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def _run(self):
+        while self.subscribers or self._pending:
+            try:
+                for path, action, is_dir in await run_in_threadpool(self.poll):
+                    self.publish(path, action, is_dir)
+            except Exception as e:
+                print(f"Warning: change feed poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+
+change_feed_settings = server_config.get("server_settings", {}).get("change_feed", {})
+change_feed = ChangeFeed(
+    folders=change_feed_settings.get("folders", ["output"]),
+    poll_interval=float(change_feed_settings.get("poll_interval", 1.0)),
+    debounce=float(change_feed_settings.get("debounce", 2.0)),
+    max_depth=int(change_feed_settings.get("max_depth", 4)),
+    history=int(change_feed_settings.get("history", 1000)),
+)
+
+# Seconds between SSE keep-alive comments on an idle change feed
+CHANGE_FEED_HEARTBEAT = 15
+
+
+@app.post("/api/notify")
+async def notify_outputs_changed(request: Request):
+    """Hook for the pipeline to report written outputs, e.g. {"paths": ["output/P1/voxels/scan1"]}."""
+    try:
+        body = await request.json()
+    except Exception:
+        body = None
+    url_paths = body.get("paths") if isinstance(body, dict) else None
+    if not isinstance(url_paths, list) or not all(isinstance(url_path, str) for url_path in url_paths):
+        raise HTTPException(status_code=400, detail="Expected JSON body with a 'paths' list of strings")
+    invalidated = []
+    for url_path in url_paths:
+        absolute_path = map_url_to_actual_path(url_path.strip("/")).resolve()
+        if not is_allowed_directory(absolute_path):
+            continue
+        directory_size_index.invalidate(absolute_path)
+        change_feed.publish(url_path.strip("/"), "modified", absolute_path.is_dir())
+        invalidated.append(url_path)
+    return {"invalidated": invalidated}
+
+
+@app.get("/api/events")
+async def stream_change_events(request: Request, patient_id: str = Query(None)):
+    """Server-sent events for changes under the watched folders (new patients, scans, segmentations, ...).
+
+    Each event is ``event: change`` with a JSON body; ``event: reset`` means
+    events were missed and the client should re-list. Reconnecting clients
+    resume from the ``Last-Event-ID`` header.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    queue, replay, reset = change_feed.subscribe(last_event_id)
+
+    def format_event(event: dict) -> str:
+        return f"id: {event['id']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            if reset:
+                yield f"id: {change_feed.last_id}\nevent: reset\ndata: {{}}\n\n"
+            for event in replay:
+                if patient_id is None or event["patient_id"] == patient_id:
+                    yield format_event(event)
+            while not await request.is_disconnected():
+                if queue.overflowed:
+                    queue.overflowed = False
+                    while not queue.empty():
+                        queue.get_nowait()
+                    yield f"id: {change_feed.last_id}\nevent: reset\ndata: {{}}\n\n"
+                    continue
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=CHANGE_FEED_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if patient_id is None or event["patient_id"] == patient_id:
+                    yield format_event(event)
+        finally:
+            change_feed.unsubscribe(queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    lines = request_metrics.render()
+    pool = volume_worker_pool
+    lines += [
+        "# TYPE image_server_worker_pool_in_flight gauge",
+        f"image_server_worker_pool_in_flight {pool.in_flight}",
+        "# TYPE image_server_worker_pool_queue_depth gauge",
+        f"image_server_worker_pool_queue_depth {max(0, pool.in_flight - pool.workers)}",
+        "# TYPE image_server_worker_pool_rejected_total counter",
+        f"image_server_worker_pool_rejected_total {pool.rejected}",
+        "# TYPE image_server_change_feed_subscribers gauge",
+        f"image_server_change_feed_subscribers {len(change_feed.subscribers)}",
+    ]
+    cache_stats = {name: cache.stats() for name, cache in CACHE_REGISTRY.items()}
+    for metric, key, kind in (
+        ("cache_hits_total", "hits", "counter"),
+        ("cache_misses_total", "misses", "counter"),
+        ("cache_evictions_total", "evictions", "counter"),
+        ("cache_bytes", "bytes", "gauge"),
+        ("cache_hit_ratio", "hit_rate", "gauge"),
+    ):
+        lines.append(f"# TYPE image_server_{metric} {kind}")
+        for name, stats in sorted(cache_stats.items()):
+            lines.append(f'image_server_{metric}{{cache="{name}"}} {stats[key]}')
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    return {name: cache.stats() for name, cache in CACHE_REGISTRY.items()}
+
+
 @app.get("/{full_path:path}")
 @app.head("/{full_path:path}")
 async def serve_files(request: Request, full_path: str):
     if full_path == "" or full_path == ".":
         return generate_restricted_root_listing()
 
-    def map_url_to_actual_path(url_path: str) -> Path:
-        for folder_config in server_config.get("viewable_folders", []):
-            folder_url_path = folder_config.get("url_path", folder_config.get("name", ""))
-            if url_path.startswith(folder_url_path + "/") or url_path == folder_url_path:
-                actual_folder_path = Path(folder_config.get("path", ""))
-                if url_path == folder_url_path:
-                    return actual_folder_path
-                else:
-                    subpath = url_path[len(folder_url_path):].lstrip("/")
-                    return actual_folder_path / subpath
-        return Path(output_folder) / url_path
+    storage_target = resolve_storage(full_path.strip("/"))
+    if storage_target is not None and not isinstance(storage_target[1], LocalStorage):
+        return await serve_from_storage(request, full_path, *storage_target)
 
     absolute_path = map_url_to_actual_path(full_path)
 
@@ -511,6 +2053,20 @@ async def serve_files(request: Request, full_path: str):
     except Exception:
         raise HTTPException(status_code=404, detail="Not found")
 
+    if not absolute_path.exists() and absolute_path.suffix == ".nii" and \
+            server_config.get("server_settings", {}).get("gzip_content_encoding", False):
+        gz_path = absolute_path.with_name(absolute_path.name + ".gz")
+        if gz_path.is_file():
+            return await serve_gzip_encoded_nifti(request, gz_path)
+        store_path = absolute_path.parent / LABEL_STORE_FILENAME
+        if store_path.is_file():
+            # VOXEL_STORE=packed scans have no per-label files; expand from the store
+            return await serve_gzip_encoded_nifti(request, await store_label_path(request, store_path, gz_path.name))
+
+    if not absolute_path.exists() and absolute_path.name.endswith(".nii.gz") and \
+            (absolute_path.parent / LABEL_STORE_FILENAME).is_file():
+        return await serve_store_label(request, absolute_path.parent / LABEL_STORE_FILENAME, absolute_path.name)
+
     if not absolute_path.exists():
         raise HTTPException(status_code=404, detail="Not found")
 
@@ -520,60 +2076,282 @@ async def serve_files(request: Request, full_path: str):
         request_path = "/" + full_path.strip("/")
         if request_path != "/" and not request_path.endswith("/"):
             request_path += "/"
-        html_content = generate_directory_listing(absolute_path, request_path)
-        return HTMLResponse(content=html_content, status_code=200)
+        try:
+            offset = max(0, int(request.query_params.get("offset", "0")))
+            limit = request.query_params.get("limit")
+            limit = max(1, min(int(limit), MAX_LISTING_LIMIT)) if limit else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="offset and limit must be integers")
+        prefix = request.query_params.get("prefix") or None
+        if request.query_params.get("format") == "json":
+            try:
+                depth = max(1, min(int(request.query_params.get("depth", "1")), MAX_LISTING_DEPTH))
+            except ValueError:
+                raise HTTPException(status_code=400, detail="depth must be an integer")
+            pattern = request.query_params.get("glob") or None
+            if depth > 1:
+                listing = await run_in_threadpool(generate_directory_json, absolute_path, request_path, depth, pattern)
+                return listing_response(request, absolute_path, JSONResponse(content=listing))
+            page = await run_in_threadpool(scan_directory_page, absolute_path, offset, limit, prefix, pattern)
+            chunks = iter_directory_json(request_path, page, pattern, prefix, limit)
+            return streamed_listing_response(request, absolute_path, page, chunks, "application/json")
+        limit = limit or LISTING_PAGE_SIZE
+        page = await run_in_threadpool(scan_directory_page, absolute_path, offset, limit, prefix)
+        page["total_size"] = await run_in_threadpool(listing_total_size, absolute_path)
+        chunks = generate_directory_listing(request_path, page, limit, page["total_size"], prefix)
+        return streamed_listing_response(request, absolute_path, page, chunks, "text/html; charset=utf-8")
     else:
         raise HTTPException(status_code=404, detail="Not found")
 
 
-async def serve_file_with_range(request: Request, file_path: Path):
-    import re
-    file_size = file_path.stat().st_size
-    range_header = request.headers.get('range')
-    if not range_header:
-        return FileResponse(
-            file_path,
-            headers={
-                "Accept-Ranges": "bytes",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
-                "Access-Control-Allow-Headers": "Range"
-            }
-        )
-    range_match = re.match(r'bytes=(\d+)-(\d*)', range_header)
-    if not range_match:
-        raise HTTPException(status_code=416, detail="Range Not Satisfiable")
-    start = int(range_match.group(1))
-    end = int(range_match.group(2)) if range_match.group(2) else file_size - 1
-    if start >= file_size or end >= file_size or start > end:
-        raise HTTPException(status_code=416, detail="Range Not Satisfiable")
-    content_length = end - start + 1
-    def iter_file_range():
-        with open(file_path, 'rb') as f:
-            f.seek(start)
-            remaining = content_length
-            while remaining > 0:
-                chunk_size = min(8192, remaining)
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                remaining -= len(chunk)
-                yield chunk
-    return StreamingResponse(
-        iter_file_range(),
-        status_code=206,
+# Read sizes for file responses scale with the file: small files keep Starlette's
+# 64 KiB default, large volumes are streamed in up to 1 MiB reads.
+MIN_FILE_CHUNK = 64 * 1024
+MAX_FILE_CHUNK = 1024 * 1024
+
+
+def adaptive_chunk_size(file_size: int) -> int:
+    chunk = max(MIN_FILE_CHUNK, min(MAX_FILE_CHUNK, file_size // 64))
+    return chunk - chunk % MIN_FILE_CHUNK
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse with chunk sizes adapted to the file size.
+
+    Starlette's FileResponse parses single and multiple byte ranges (answering
+    the latter as multipart/byteranges), honours If-Range against the ETag and
+    Last-Modified validators, and hands whole-file responses to servers that
+    implement the ASGI pathsend extension for zero-copy sendfile.
+    """
+
+    def __init__(self, path: Path, stat_result: os.stat_result, **kwargs):
+        super().__init__(path, stat_result=stat_result, **kwargs)
+        self.chunk_size = adaptive_chunk_size(stat_result.st_size)
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """Strong validator from inode, size and nanosecond mtime."""
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def cache_control_for(path: Path) -> str:
+    """Cache-Control of the viewable folder containing ``path``, else the server default."""
+    return folder_routes.check(str(path))[1]
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float = None) -> bool:
+    """Evaluate If-None-Match (weak comparison) or, failing that, If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def listing_response(request: Request, directory_path: Path, response: Response) -> Response:
+    """Attach a weak content ETag to a directory listing and answer 304 when it matches."""
+    etag = f'W/"{hashlib.sha1(response.body).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control_for(directory_path)}
+    if is_not_modified(request, etag):
+        return not_modified_response(headers)
+    response.headers.update(headers)
+    return response
+
+
+def streamed_listing_response(request: Request, directory_path: Path, page: dict, chunks, media_type: str) -> Response:
+    """Stream a listing page; the weak ETag hashes the page data instead of the rendered body."""
+    etag = f'W/"{hashlib.sha1(repr(sorted(page.items())).encode()).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control_for(directory_path)}
+    if is_not_modified(request, etag):
+        return not_modified_response(headers)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+async def serve_file_with_range(request: Request, file_path: Path, extra_headers: dict = None, media_type: str = None):
+    stat_result = file_path.stat()
+    etag = file_etag(stat_result)
+    validator_headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control_for(file_path),
+        "Access-Control-Allow-Origin": "*",
+    }
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return not_modified_response(validator_headers)
+    return RangeFileResponse(
+        file_path,
+        stat_result=stat_result,
+        media_type=media_type,
         headers={
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
+            **validator_headers,
             "Accept-Ranges": "bytes",
-            "Content-Length": str(content_length),
-            "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
-            "Access-Control-Allow-Headers": "Range"
-        },
-        media_type="application/octet-stream"
+            "Access-Control-Allow-Headers": "Range, If-Range, If-None-Match, If-Modified-Since",
+            **(extra_headers or {})
+        }
     )
 
 
+def accepts_gzip(request: Request) -> bool:
+    """True if Accept-Encoding allows gzip (explicitly or via *) with a non-zero q-value."""
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    if "gzip" in accepted:
+        return accepted["gzip"] > 0
+    return accepted.get("*", 0) > 0
+
+
+def iter_gunzip(gz_path: Path, chunk_size: int = MAX_FILE_CHUNK):
+    decompressor = zlib.decompressobj(31)
+    with open(gz_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            data = decompressor.decompress(chunk)
+            # Concatenated gzip members (e.g. from parallel writers) follow one another
+            while decompressor.eof and decompressor.unused_data:
+                remainder = decompressor.unused_data
+                decompressor = zlib.decompressobj(31)
+                data += decompressor.decompress(remainder)
+            if data:
+                yield data
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+async def serve_gzip_encoded_nifti(request: Request, gz_path: Path):
+    """Serve ``x.nii.gz`` as the ``x.nii`` resource, letting the browser inflate it.
+
+    Clients accepting gzip get the stored bytes with Content-Encoding: gzip; byte
+    ranges then address the encoded representation, as HTTP specifies. Other
+    clients get the decompressed stream, without range support.
+    """
+    vary = {"Vary": "Accept-Encoding"}
+    if accepts_gzip(request):
+        return await serve_file_with_range(
+            request,
+            gz_path,
+            extra_headers={"Content-Encoding": "gzip", **vary},
+            media_type="application/octet-stream",
+        )
+    stat_result = gz_path.stat()
+    etag = file_etag(stat_result)[:-1] + '-identity"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control_for(gz_path),
+        "Accept-Ranges": "none",
+        "Access-Control-Allow-Origin": "*",
+        **vary,
+    }
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return not_modified_response(headers)
+    return StreamingResponse(iter_gunzip(gz_path), media_type="application/octet-stream", headers=headers)
+
+
+def scan_storage_entries(backend, key: str, depth: int = 1, pattern: str = None) -> list:
+    """``scan_directory_entries`` for a storage backend: one list call per level."""
+    entries = []
+    for info in backend.list(key):
+        if info.is_dir:
+            item = {"name": info.name, "type": "directory", "mtime": info.mtime}
+            if depth > 1:
+                item["children"] = scan_storage_entries(backend, f"{key}/{info.name}".strip("/"), depth - 1, pattern)
+            entries.append(item)
+        elif not pattern or fnmatch.fnmatch(info.name, pattern):
+            entries.append({"name": info.name, "type": "file", "size": info.size, "mtime": info.mtime})
+    return entries
+
+
+def parse_byte_range(range_header: str, size: int):
+    """(start, end) for a single ``bytes=`` range, None to send the whole object, 416 if unsatisfiable."""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size - 1)
+
+
+async def serve_from_storage(request: Request, full_path: str, folder_config: dict, backend, key: str):
+    """Serve a file or JSON listing from a non-local backend, passing object bytes straight through.
+
+    Single byte ranges become one ranged GET; multi-range requests get the
+    whole object. Directory listings are always JSON (``?depth``/``?glob`` apply).
+    """
+    info = await run_in_threadpool(backend.stat, key)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    if info.is_dir:
+        try:
+            depth = max(1, min(int(request.query_params.get("depth", "1")), MAX_LISTING_DEPTH))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="depth must be an integer")
+        pattern = request.query_params.get("glob") or None
+        request_path = "/" + full_path.strip("/") + "/"
+        entries = await run_in_threadpool(scan_storage_entries, backend, key, depth, pattern)
+        return JSONResponse(content={"path": request_path, "depth": depth, "glob": pattern, "entries": entries})
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": info.etag,
+        "Last-Modified": formatdate(info.mtime, usegmt=True),
+        "Cache-Control": folder_config.get("cache_control")
+        or server_config.get("server_settings", {}).get("cache_control", DEFAULT_CACHE_CONTROL),
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
+        "Access-Control-Allow-Headers": "Range, If-Range, If-None-Match, If-Modified-Since",
+    }
+    if is_not_modified(request, info.etag, info.mtime):
+        return not_modified_response(headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", info.etag) == info.etag and info.size:
+        byte_range = parse_byte_range(range_header, info.size)
+    start, end = byte_range or (0, info.size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    status_code = 200
+    if byte_range is not None:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    if request.method == "HEAD" or info.size == 0:
+        return Response(status_code=status_code, headers=headers, media_type="application/octet-stream")
+    chunks = backend.iter_range(key, start, end, adaptive_chunk_size(info.size))
+    return StreamingResponse(chunks, status_code=status_code, headers=headers, media_type="application/octet-stream")
+
+
 origins = ["*"]
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,162 @@
+"""
+Storage backends for the image server.
+
+Each viewable folder is served from a backend addressed by keys relative to
+the folder root ("P1/nifti/scan1.nii.gz"). ``LocalStorage`` wraps a POSIX
+directory; ``S3Storage`` talks to any S3-compatible object store (AWS, MinIO,
+Ceph RGW) through a pooled boto3 client, serving byte ranges with ranged GETs
+and streaming bodies straight through without buffering whole objects.
+"""
+
+import os
+import posixpath
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class ObjectInfo:
+    name: str
+    size: int
+    mtime: float
+    etag: str
+    is_dir: bool = False
+
+
+def normalize_key(key: str) -> str:
+    """Collapse ``key`` to a relative POSIX key, rejecting traversal outside the root."""
+    normalized = posixpath.normpath("/" + key.strip("/")).lstrip("/")
+    if normalized == ".":
+        return ""
+    return normalized
+
+
+class LocalStorage:
+    """Files under a local directory (e.g. the /data/output volume)."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path_for(self, key: str) -> Path:
+        return self.root / normalize_key(key)
+
+    def stat(self, key: str):
+        path = self.path_for(key)
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        etag = f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+        return ObjectInfo(path.name, st.st_size, st.st_mtime, etag, path.is_dir())
+
+    def list(self, key: str) -> list:
+        entries = []
+        with os.scandir(self.path_for(key)) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                st = entry.stat()
+                is_dir = entry.is_dir()
+                entries.append(ObjectInfo(entry.name, 0 if is_dir else st.st_size, st.st_mtime, "", is_dir))
+        return sorted(entries, key=lambda e: (not e.is_dir, e.name))
+
+    def iter_range(self, key: str, start: int, end: int, chunk_size: int):
+        """Yield bytes ``start``..``end`` (inclusive) of ``key``."""
+        with open(self.path_for(key), "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def _is_not_found(error: Exception) -> bool:
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class S3Storage:
+    """Objects under ``prefix`` in an S3-compatible bucket.
+
+    "Directories" are key prefixes, listed with ``Delimiter="/"``. Credentials
+    come from the usual AWS environment variables or instance profile. A
+    pre-built ``client`` can be passed in, e.g. one pointed at a local MinIO.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None,
+                 max_pool_connections: int = 32, client=None):
+        self.bucket = bucket
+        self.prefix = normalize_key(prefix)
+        if client is None:
+            try:
+                import boto3
+                from botocore.config import Config
+            except ImportError:
+                raise RuntimeError("The s3 storage driver requires boto3: pip install 'vista3d-image-server[s3]' or pip install boto3")
+            client = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                region_name=region,
+                config=Config(max_pool_connections=max_pool_connections, retries={"mode": "adaptive"}),
+            )
+        self.client = client
+
+    def _object_key(self, key: str) -> str:
+        return posixpath.join(self.prefix, normalize_key(key)) if self.prefix else normalize_key(key)
+
+    def stat(self, key: str):
+        object_key = self._object_key(key)
+        name = posixpath.basename(object_key)
+        if object_key:
+            try:
+                head = self.client.head_object(Bucket=self.bucket, Key=object_key)
+                return ObjectInfo(name, head["ContentLength"], head["LastModified"].timestamp(), head["ETag"])
+            except Exception as e:
+                if not _is_not_found(e):
+                    raise
+        listing = self.client.list_objects_v2(
+            Bucket=self.bucket, Prefix=object_key + "/" if object_key else "", MaxKeys=1
+        )
+        if object_key and not listing.get("KeyCount", len(listing.get("Contents", []))):
+            return None
+        return ObjectInfo(name, 0, 0.0, "", True)
+
+    def list(self, key: str) -> list:
+        object_key = self._object_key(key)
+        prefix = object_key + "/" if object_key else ""
+        entries = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/"):
+            for common in page.get("CommonPrefixes", []):
+                entries.append(ObjectInfo(common["Prefix"][len(prefix):].rstrip("/"), 0, 0.0, "", True))
+            for obj in page.get("Contents", []):
+                name = obj["Key"][len(prefix):]
+                if not name or name.startswith("."):
+                    continue
+                entries.append(ObjectInfo(name, obj["Size"], obj["LastModified"].timestamp(), obj["ETag"]))
+        return sorted(entries, key=lambda e: (not e.is_dir, e.name))
+
+    def iter_range(self, key: str, start: int, end: int, chunk_size: int):
+        """Stream bytes ``start``..``end`` (inclusive) of ``key`` with one ranged GET."""
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self._object_key(key), Range=f"bytes={start}-{end}"
+        )
+        body = response["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+
+def build_storage(folder_config: dict):
+    """Backend for a ``viewable_folders`` entry; ``"storage": {"driver": "s3", ...}`` selects S3."""
+    storage_config = dict(folder_config.get("storage") or {})
+    driver = storage_config.pop("driver", "local")
+    if driver == "local":
+        return LocalStorage(Path(folder_config.get("path", "")))
+    if driver == "s3":
+        return S3Storage(**storage_config)
+    raise ValueError(f"Unknown storage driver for folder {folder_config.get('name')}: {driver}")
@@ -35,13 +35,14 @@ echo ""
 build_and_push() {
     local service_name=$1
     local service_path=$2
+    shift 2
     local image_name="${DOCKER_USERNAME}/vista3d-${service_name}"
     
     echo -e "${GREEN}=== Building ${service_name} ===${NC}"
     cd "${PROJECT_ROOT}/${service_path}"
     
     echo "Building ${image_name}:${VERSION}..."
-    docker build -t "${image_name}:${VERSION}" .
+    docker build "$@" -t "${image_name}:${VERSION}" .
     
     echo "Tagging as latest..."
     docker tag "${image_name}:${VERSION}" "${image_name}:latest"
@@ -57,7 +58,7 @@ build_and_push() {
 }
 
 # Build and push image_server
-build_and_push "image-server" "../image_server"
+build_and_push "image-server" "../image_server" --build-context "frontend_conf=${PROJECT_ROOT}/../frontend/conf"
 
 # Build and push frontend
 build_and_push "frontend" "../frontend"